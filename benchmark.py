@@ -0,0 +1,389 @@
+from __future__ import annotations
+
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+from typing import Any, Callable
+
+import numpy as np
+
+import edge_ai.controller as controller
+import edge_ai.sensor as sensor
+from edge_ai.bus import SimulatedBus
+from edge_ai.emulator import ADS1015Emulator, LIS3DHEmulator, waveform
+
+# Bus and sensor benchmarks run on SimulatedBus register files, where data
+# is always ready, so they measure the cost of the Python stack on top of a
+# bus with a fixed per-transaction latency. Controller benchmarks run on
+# the chip emulators, which produce data at the configured rates. Results
+# are printed (or written) as JSON, and --compare prints the relative
+# change of every figure to an earlier run.
+
+LIS3DH = sensor.accel.LIS3DH
+ADS1015 = sensor.adc.ADS1015
+
+
+def _lis3dh_bus(latency: float) -> SimulatedBus:
+    # New data always ready, a FIFO holding 16 samples
+    return SimulatedBus(
+        {
+            LIS3DH.STATUS_REGISTER: [LIS3DH.STATUS_ZYXDA],
+            LIS3DH.OUT_X_L: [0x00, 0x10, 0x00, 0x20, 0x00, 0x40],
+            LIS3DH.FIFO_SRC_REGISTER: [16],
+        },
+        latency=latency,
+    )
+
+
+def _ads1015_bus(latency: float) -> SimulatedBus:
+    # A constant 1.5 V conversion
+    return SimulatedBus(
+        {
+            ADS1015.CONFIG_REGISTER: ADS1015.CONFIG_REGISTER_DEFAULT,
+            ADS1015.CONVERSION_REGISTER: [0x5D, 0xC0],
+        },
+        register_width=2,
+        latency=latency,
+    )
+
+
+def _lis3dh_emulator(latency: float) -> LIS3DHEmulator:
+    # 0.5 g, 10 Hz vibration on z, on top of gravity
+    return LIS3DHEmulator(
+        waveform.axes(
+            waveform.constant(0.0),
+            waveform.constant(0.0),
+            waveform.sine(0.5, 10, offset=1.0),
+        ),
+        latency=latency,
+    )
+
+
+def _ads1015_emulator(latency: float, period: float = 1.0) -> ADS1015Emulator:
+    # An object (1.5 V) in front of the sensor for half of every period
+    return ADS1015Emulator(
+        {
+            0: waveform.square(1.5, 0.0, period),
+            1: waveform.constant(0.0),
+            2: waveform.sine(0.5, 50, offset=1.0),
+            3: waveform.constant(0.5),
+        },
+        latency=latency,
+        clock_error=0.05,
+    )
+
+
+def _summarize(latencies: list[int]) -> dict[str, float]:
+    latencies = np.asarray(latencies, dtype=np.float64)
+
+    return {
+        "calls": len(latencies),
+        "mean_ns": float(latencies.mean()),
+        "median_ns": float(np.median(latencies)),
+        "p99_ns": float(np.percentile(latencies, 99)),
+        "max_ns": float(latencies.max()),
+    }
+
+
+def _time_calls(function: Callable[[], Any], iterations: int) -> dict[str, float]:
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter_ns()
+        function()
+        latencies.append(time.perf_counter_ns() - start)
+
+    return _summarize(latencies)
+
+
+def bench_bus(iterations: int, latency: float) -> dict[str, Any]:
+    # Cost of each BaseBus method, on top of the bus latency
+    bus = _lis3dh_bus(latency)
+    cached = _lis3dh_bus(latency)
+    cached.enable_cache([LIS3DH.CTRL_REG1])
+
+    register = LIS3DH.OUT_X_L | bus.AUTO_INCREMENT
+    batch = [("read", register, 6), ("write", LIS3DH.CTRL_REG1, [0x97])]
+
+    return {
+        "read_register": _time_calls(
+            lambda: bus.read_register(LIS3DH.STATUS_REGISTER), iterations
+        ),
+        "read_register_list": _time_calls(
+            lambda: bus.read_register_list(register, 6), iterations
+        ),
+        "read_register_bytes": _time_calls(
+            lambda: bus.read_register_bytes(register, 6), iterations
+        ),
+        "write_register": _time_calls(
+            lambda: bus.write_register(LIS3DH.CTRL_REG1, 0x97), iterations
+        ),
+        "write_register_list": _time_calls(
+            lambda: bus.write_register_list(LIS3DH.CTRL_REG1, [0x97, 0x00]),
+            iterations,
+        ),
+        "batch": _time_calls(lambda: bus.batch(batch), iterations),
+        "cached_read_register": _time_calls(
+            lambda: cached.read_register(LIS3DH.CTRL_REG1), iterations
+        ),
+    }
+
+
+def bench_sensors(iterations: int, latency: float) -> dict[str, Any]:
+    motionsensor = LIS3DH(_lis3dh_bus(latency))
+    adc = ADS1015(_ads1015_bus(latency))
+
+    return {
+        "lis3dh_read": _time_calls(motionsensor.read, iterations),
+        "lis3dh_read_new_data": _time_calls(motionsensor.read_new_data, iterations),
+        "lis3dh_read_fifo": _time_calls(motionsensor.read_fifo, iterations),
+        "ads1015_read": _time_calls(adc.read, iterations),
+    }
+
+
+def bench_controller_read(iterations: int, latency: float) -> dict[str, Any]:
+    # Pipe round trip of BaseController.read, sensor read included
+    motionsensor = controller.accel.LIS3DH.Simulated(_lis3dh_emulator(latency))
+    motionsensor.start()
+
+    try:
+        # the first reply waits for the subprocess to set the sensor up
+        motionsensor.read()
+
+        return {"lis3dh_read": _time_calls(motionsensor.read, iterations)}
+    finally:
+        motionsensor.stop()
+
+
+def _achieved_rate(
+    sensor_controller: controller.BaseController,
+    read: Callable[[], list[controller.Capture]],
+    configured: float,
+    seconds: float,
+) -> dict[str, float]:
+    sensor_controller.start()
+
+    try:
+        sensor_controller.read()
+
+        start = time.perf_counter()
+        captures = read()
+        elapsed = time.perf_counter() - start
+    finally:
+        sensor_controller.stop()
+
+    samples = sum(len(capture) for capture in captures)
+    gaps = [capture.max_gap() for capture in captures if len(capture) > 1]
+
+    return {
+        "samples": samples,
+        "configured_rate": configured,
+        "achieved_rate": samples / seconds,
+        "overruns": sum(capture.metadata.get("overruns", 0) for capture in captures),
+        "max_gap": max(gaps) if gaps else 0.0,
+        "call_time": elapsed,
+    }
+
+
+def bench_read_for(seconds: float, latency: float) -> dict[str, Any]:
+    results = {}
+
+    for name, datarate, fifo, shared_memory in [
+        ("lis3dh_polling", 400, False, False),
+        ("lis3dh_polling_5376", 5376, False, False),
+        ("lis3dh_fifo", 5376, True, False),
+        ("lis3dh_fifo_shared_memory", 5376, True, True),
+    ]:
+        motionsensor = controller.accel.LIS3DH.Simulated(_lis3dh_emulator(latency))
+        motionsensor.set_datarate(datarate)
+        motionsensor.use_fifo(fifo)
+        if shared_memory:
+            motionsensor.use_shared_memory()
+
+        results[name] = _achieved_rate(
+            motionsensor,
+            lambda: [motionsensor.read_for(seconds)],
+            datarate,
+            seconds,
+        )
+
+    adc = controller.adc.ADS1015.Simulated(_ads1015_emulator(latency))
+    adc.set_data_rate(3300)
+    results["ads1015"] = _achieved_rate(
+        adc, lambda: [adc.read_for(seconds)], 3300, seconds
+    )
+
+    # conversions of all four channels together
+    adc = controller.adc.ADS1015.Simulated(_ads1015_emulator(latency))
+    adc.set_data_rate(3300)
+    results["ads1015_scan"] = _achieved_rate(
+        adc,
+        lambda: list(adc.scan_for(seconds, [0, 1, 2, 3]).values()),
+        3300,
+        seconds,
+    )
+
+    return results
+
+
+def bench_pipeline(sections: int, latency: float) -> dict[str, Any]:
+    # The script's trigger, capture and transform stages with a stub sink,
+    # an object showing up every second
+    import script
+    from edge_ai.pipeline import Pipeline, Source, Stage
+
+    config = {
+        "number_measurements": sections,
+        "pre_trigger": 0.1,
+        "window_length": 0.3,
+        "device_id": 1,
+    }
+
+    motionsensor = controller.accel.LIS3DH.Simulated(_lis3dh_emulator(latency))
+    motionsensor.set_datarate(5376)
+    motionsensor.use_circular_buffer(1.0)
+
+    adc = controller.adc.ADS1015.Simulated(_ads1015_emulator(latency, period=1.0))
+    adc.set_trigger(1.0, 0.5)
+
+    engine = controller.AcquisitionEngine()
+    engine.add(motionsensor)
+    engine.add(adc)
+    engine.start()
+
+    written = []
+
+    def sink(section: Any) -> None:
+        written.append(len(section))
+
+    try:
+        pipeline = Pipeline(
+            [
+                Source("trigger", script._detect_objects(adc, config)),
+                Stage("capture", script._capture_window(motionsensor, config)),
+                Stage("transform", script._to_section(config)),
+                Stage("sink", sink),
+            ]
+        )
+
+        start = time.perf_counter()
+        pipeline.start()
+        pipeline.join()
+        elapsed = time.perf_counter() - start
+    finally:
+        engine.stop()
+
+    return {
+        "sections": len(written),
+        "mean_section_length": float(np.mean(written)) if written else 0.0,
+        "total_time": elapsed,
+        "stages": pipeline.timings(),
+    }
+
+
+BENCHMARKS = ["bus", "sensors", "controller_read", "read_for", "pipeline"]
+
+
+def run(benchmarks: list[str], args: argparse.Namespace) -> dict[str, Any]:
+    results = {}
+    for name in benchmarks:
+        if name == "bus":
+            results[name] = bench_bus(args.iterations, args.latency)
+        elif name == "sensors":
+            results[name] = bench_sensors(args.iterations, args.latency)
+        elif name == "controller_read":
+            results[name] = bench_controller_read(args.iterations, args.latency)
+        elif name == "read_for":
+            results[name] = bench_read_for(args.seconds, args.latency)
+        elif name == "pipeline":
+            results[name] = bench_pipeline(args.sections, args.latency)
+
+    return results
+
+
+def _revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _flatten(results: Any, prefix: str = "") -> dict[str, float]:
+    # "benchmark.case.figure" -> value, for every number in the results
+    if isinstance(results, dict):
+        flat = {}
+        for key, value in results.items():
+            flat.update(_flatten(value, f"{prefix}{key}."))
+        return flat
+
+    if isinstance(results, (int, float)) and not isinstance(results, bool):
+        return {prefix[:-1]: results}
+
+    return {}
+
+
+def compare(baseline: dict[str, Any], current: dict[str, Any]) -> None:
+    old = _flatten(baseline["results"])
+    new = _flatten(current["results"])
+
+    for key in sorted(old.keys() & new.keys()):
+        if old[key]:
+            change = f"{(new[key] - old[key]) / old[key] * 100:+8.1f} %"
+        else:
+            change = "       -"
+        print(f"{key:<60}{old[key]:>16.6g}{new[key]:>16.6g}  {change}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--only",
+        nargs="+",
+        choices=BENCHMARKS,
+        default=BENCHMARKS,
+        help="benchmarks to run, all of them by default",
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.0,
+        help="simulated bus latency per transaction in seconds",
+    )
+    parser.add_argument(
+        "--iterations", type=int, default=10000, help="calls per latency benchmark"
+    )
+    parser.add_argument(
+        "--seconds", type=float, default=2.0, help="length of each read_for"
+    )
+    parser.add_argument(
+        "--sections", type=int, default=5, help="sections through the pipeline"
+    )
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="JSON results of an earlier run")
+    args = parser.parse_args()
+
+    report = {
+        "meta": {
+            "revision": _revision(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "machine": platform.machine(),
+            "time": time.time(),
+            "latency": args.latency,
+        },
+        "results": run(args.only, args),
+    }
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
@@ -84,11 +84,14 @@ def motionsensor_controller_run_for_spi() -> None:
 
     print("Running for 10 seconds...")
 
-    values = motioncontrol.read_for(10)
+    capture = motioncontrol.read_for(10)
 
-    print(f"First 20 results out of {len(values)}:")
+    print(f"First 20 results out of {len(capture)}:")
 
-    final_results = [[val[0], _format_motionsensor_output(val[1])] for val in values]
+    final_results = [
+        [time, _format_motionsensor_output(values)]
+        for time, values in zip(capture.format(), capture.values.tolist())
+    ]
 
     for line in final_results[:20]:
         print(line)
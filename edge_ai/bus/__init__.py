@@ -1,3 +1,5 @@
 from .basebus import BaseBus
 from .i2c import I2C
 from .spi import SPI
+from .stats import BusStats
+from .simulated import SimulatedBus
@@ -1,10 +1,58 @@
 from __future__ import annotations
 
+import time
 from abc import ABC, abstractmethod
-from typing import List
+from contextlib import contextmanager
+from typing import Any, Callable, Iterable, Iterator, List, Tuple
+
+from .stats import BusStats
+
+# ("read", register, length) or ("write", register, values), see BaseBus.batch
+Message = Tuple[str, int, Any]
 
 
 class BaseBus(ABC):
+    """
+    Base class for register buses.
+    Subclasses implement the raw device transfers (_read_register, ...), the
+    public methods add an opt-in write-through shadow cache on top: registers
+    passed to enable_cache() are read from the device at most once until
+    invalidated, and writes to them can be coalesced with deferred_writes().
+    batch() runs a list of reads and writes in order, as one transaction on
+    buses that support it (_transfer), one by one otherwise.
+    enable_stats() counts the transactions that reach the device (see
+    INSTRUMENTED) in a BusStats, by wrapping those methods on the instance,
+    so a bus without stats runs the plain methods.
+    """
+
+    # Flag OR'd into a register address to enable address auto-increment on
+    # multi-byte transfers (ST sensor convention, bus dependent)
+    AUTO_INCREMENT = 0x00
+
+    # Largest number of bytes read_register_list can fetch in one transfer
+    MAX_READ_LENGTH = 32
+
+    # Methods issuing device transactions, timed by enable_stats()
+    INSTRUMENTED = (
+        "_read_register",
+        "_read_register_list",
+        "_read_register_bytes",
+        "_write_register",
+        "_write_register_list",
+        "_transfer",
+    )
+
+    def __init__(self) -> None:
+        self._cacheable = set()
+        self._cache = {}
+
+        # register -> value waiting to be written, while writes are deferred
+        self._deferred = None
+
+        self._stats = None
+        # instrumented calls in progress, calls they make are not counted again
+        self._stats_depth = 0
+
     @abstractmethod
     def start(self) -> None:
         ...
@@ -13,18 +61,231 @@ class BaseBus(ABC):
     def stop(self) -> None:
         ...
 
-    @abstractmethod
+    def enable_cache(self, registers: Iterable[int]) -> None:
+        self._cacheable.update(registers)
+
+    def enable_stats(self) -> None:
+        if self._stats is not None:
+            return
+
+        self._stats = BusStats()
+        for name in self.INSTRUMENTED:
+            setattr(self, name, self._timed(name.lstrip("_"), getattr(self, name)))
+
+    def disable_stats(self) -> None:
+        # Back to the plain methods
+        for name in self.INSTRUMENTED:
+            self.__dict__.pop(name, None)
+
+        self._stats = None
+
+    def stats(self, reset: bool = False) -> dict[str, Any] | None:
+        # Counters as plain types, None while stats are disabled
+        if self._stats is None:
+            return None
+
+        stats = self._stats.as_dict()
+        if reset:
+            self._stats = BusStats()
+
+        return stats
+
+    def _timed(self, operation: str, method: Callable[..., Any]) -> Callable[..., Any]:
+        def timed(*args: Any) -> Any:
+            if self._stats_depth:
+                return method(*args)
+
+            self._stats_depth += 1
+            start = time.perf_counter_ns()
+            try:
+                return method(*args)
+            finally:
+                elapsed = time.perf_counter_ns() - start
+                self._stats_depth -= 1
+
+                register, nbytes = self._stats_key(operation, args)
+                if register is not None:
+                    # bursts count towards the register they start at
+                    register &= ~self.AUTO_INCREMENT
+                self._stats.record(operation, register, nbytes, elapsed)
+
+        return timed
+
+    def _stats_key(self, operation: str, args: tuple) -> tuple[int | None, int]:
+        # Register and number of data bytes of an instrumented call
+        if operation == "transfer":
+            nbytes = 0
+            for kind, _, value in args[0]:
+                nbytes += value if kind == "read" else len(value)
+            return None, nbytes
+        elif operation in ("read_register", "write_register"):
+            return args[0], 1
+        elif operation == "write_register_list":
+            return args[0], len(args[1])
+
+        # read_register_list, read_register_bytes
+        return args[0], args[1]
+
+    def invalidate(self, register: int | None = None) -> None:
+        # Forget the shadow copy of a register (or all of them), so the next
+        # read goes to the device
+        if register is None:
+            self._cache.clear()
+        else:
+            self._cache.pop(register, None)
+
+    @contextmanager
+    def deferred_writes(self) -> Iterator[None]:
+        # Writes to cached registers only update the shadow copies until the
+        # block exits, then each register is written once with its final value
+        if self._deferred is not None:
+            yield
+            return
+
+        self._deferred = {}
+        try:
+            yield
+        except BaseException:
+            # the shadow copies no longer match the device
+            for register in self._deferred:
+                self._cache.pop(register, None)
+            raise
+        finally:
+            deferred, self._deferred = self._deferred, None
+
+        for register, value in deferred.items():
+            self._write(register, value)
+
     def read_register(self, register: int) -> int:
+        if register in self._cacheable:
+            return self._cached_read(register, 1)[0]
+
+        return self._read_register(register)
+
+    def read_register_list(self, register: int, length: int) -> List[int]:
+        if register in self._cacheable:
+            return list(self._cached_read(register, length))
+
+        return self._read_register_list(register, length)
+
+    def read_register_bytes(
+        self, register: int, length: int
+    ) -> bytes | bytearray | memoryview:
+        # read_register_list as a bytes-like object, which decoders can read
+        # in place. It may be a view of a buffer the bus reuses, only valid
+        # until the next transfer.
+        if register in self._cacheable:
+            return bytes(self._cached_read(register, length))
+
+        return self._read_register_bytes(register, length)
+
+    def write_register(self, register: int, value: int) -> None:
+        if register in self._cacheable:
+            self._cached_write(register, [value])
+        else:
+            self._write_register(register, value)
+
+    def write_register_list(self, register: int, value: List[int]) -> None:
+        if register in self._cacheable:
+            self._cached_write(register, list(value))
+        else:
+            self._write_register_list(register, value)
+
+    def batch(self, messages: Iterable[Message]) -> List[List[int] | None]:
+        # Returns the values read by each message, None for writes. Reads of
+        # cached registers are answered from the shadow copies and deferred
+        # writes are held back, the rest goes to the device in order.
+        messages = list(messages)
+        results = [None] * len(messages)
+
+        to_device = []
+        for i, (kind, register, value) in enumerate(messages):
+            if register in self._cacheable:
+                if kind == "read":
+                    cached = self._cache.get(register)
+                    if cached is not None and len(cached) == value:
+                        results[i] = list(cached)
+                        continue
+                else:
+                    self._cache[register] = list(value)
+                    if self._deferred is not None:
+                        self._deferred[register] = list(value)
+                        continue
+
+            to_device.append(i)
+
+        if not to_device:
+            return results
+
+        transferred = self._transfer([messages[i] for i in to_device])
+        for i, result in zip(to_device, transferred):
+            kind, register, _ = messages[i]
+            if kind == "read":
+                results[i] = result
+                if register in self._cacheable:
+                    self._cache[register] = list(result)
+
+        return results
+
+    def _transfer(self, messages: List[Message]) -> List[List[int] | None]:
+        # Buses that can combine messages into one transaction override this
+        results = []
+        for kind, register, value in messages:
+            if kind == "read":
+                results.append(self._read_register_list(register, value))
+            elif kind == "write":
+                self._write(register, list(value))
+                results.append(None)
+            else:
+                raise Exception(f"Unknown bus message kind: {kind}")
+
+        return results
+
+    def _cached_read(self, register: int, length: int) -> List[int]:
+        value = self._cache.get(register)
+
+        if value is None or len(value) != length:
+            if length == 1:
+                value = [self._read_register(register)]
+            else:
+                value = self._read_register_list(register, length)
+
+            self._cache[register] = value
+
+        return value
+
+    def _cached_write(self, register: int, value: List[int]) -> None:
+        self._cache[register] = value
+
+        if self._deferred is not None:
+            self._deferred[register] = value
+        else:
+            self._write(register, value)
+
+    def _write(self, register: int, value: List[int]) -> None:
+        if len(value) == 1:
+            self._write_register(register, value[0])
+        else:
+            self._write_register_list(register, value)
+
+    @abstractmethod
+    def _read_register(self, register: int) -> int:
         ...
 
     @abstractmethod
-    def read_register_list(self, register: int, length: int) -> List[int]:
+    def _read_register_list(self, register: int, length: int) -> List[int]:
         ...
 
+    def _read_register_bytes(
+        self, register: int, length: int
+    ) -> bytes | bytearray | memoryview:
+        # Buses with their own transfer buffers override this
+        return bytes(self._read_register_list(register, length))
+
     @abstractmethod
-    def write_register(self, register: int, value: int) -> None:
+    def _write_register(self, register: int, value: int) -> None:
         ...
 
     @abstractmethod
-    def write_register_list(self, register: int, value: List[int]) -> None:
+    def _write_register_list(self, register: int, value: List[int]) -> None:
         ...
@@ -1,12 +1,32 @@
-from typing import List
+from __future__ import annotations
 
-import smbus2
+from typing import TYPE_CHECKING, List
 
-from .basebus import BaseBus
+from .basebus import BaseBus, Message
+
+if TYPE_CHECKING:
+    import smbus2
 
 
 class I2C(BaseBus):
+    # MSB of the sub-address
+    AUTO_INCREMENT = 0x80
+
+    # Longer reads than the SMBus block transfer limit go through i2c_rdwr,
+    # which is only limited by the kernel's 8192 bytes per message
+    SMBUS_BLOCK_LENGTH = 32
+    MAX_READ_LENGTH = 8192
+
+    # I2C_RDWR_IOCTL_MAX_MSGS, messages per i2c_rdwr call
+    MAX_MESSAGES = 42
+
+    # busnum -> [SMBus handle, number of started I2C objects using it], so
+    # devices on one adapter share it within a process
+    _handles = {}
+
     def __init__(self, address: int, busnum: int) -> None:
+        super().__init__()
+
         self._address = address
         self._busnum = busnum
 
@@ -19,22 +39,77 @@ class I2C(BaseBus):
         return self._i2c
 
     def start(self) -> None:
-        self._i2c = smbus2.SMBus(self._busnum)
+        if self._i2c is not None:
+            return
+
+        # only needed once the bus is opened, which keeps driver imports light
+        import smbus2
+
+        if self._busnum not in I2C._handles:
+            I2C._handles[self._busnum] = [smbus2.SMBus(self._busnum), 0]
+
+        handle = I2C._handles[self._busnum]
+        handle[1] += 1
+        self._i2c = handle[0]
 
     def stop(self) -> None:
         if self._i2c is None:
             raise Exception("Attempted to stop bus before starting")
 
-        self._i2c.close()
+        handle = I2C._handles[self._busnum]
+        handle[1] -= 1
+        if handle[1] == 0:
+            self._i2c.close()
+            del I2C._handles[self._busnum]
+
+        self._i2c = None
 
-    def write_register(self, register: int, value: int) -> None:
+    def _write_register(self, register: int, value: int) -> None:
         self._get_bus().write_byte_data(self._address, register, value)
 
-    def write_register_list(self, register: int, value: List[int]) -> None:
+    def _write_register_list(self, register: int, value: List[int]) -> None:
         self._get_bus().write_i2c_block_data(self._address, register, value)
 
-    def read_register(self, register: int) -> int:
+    def _read_register(self, register: int) -> int:
         return self._get_bus().read_byte_data(self._address, register)
 
-    def read_register_list(self, register: int, length: int) -> List[int]:
+    def _read_register_list(self, register: int, length: int) -> List[int]:
+        if length > self.SMBUS_BLOCK_LENGTH:
+            return self._transfer([("read", register, length)])[0]
+
         return self._get_bus().read_i2c_block_data(self._address, register, length)
+
+    def _transfer(self, messages: List[Message]) -> List[List[int] | None]:
+        # One i2c_rdwr call (per MAX_MESSAGES) for the whole batch: a read is
+        # a register pointer write followed by a repeated start read, so
+        # nothing else can address the device in between
+        from smbus2 import i2c_msg
+
+        bus = self._get_bus()
+
+        results = [None] * len(messages)
+        reads = []
+        pending = []
+        for i, (kind, register, value) in enumerate(messages):
+            if kind == "read":
+                read = i2c_msg.read(self._address, value)
+                parts = [i2c_msg.write(self._address, [register]), read]
+                reads.append((i, read))
+            elif kind == "write":
+                parts = [i2c_msg.write(self._address, [register, *value])]
+            else:
+                raise Exception(f"Unknown bus message kind: {kind}")
+
+            if len(pending) + len(parts) > self.MAX_MESSAGES:
+                bus.i2c_rdwr(*pending)
+                pending = []
+
+            pending.extend(parts)
+
+        if pending:
+            bus.i2c_rdwr(*pending)
+
+        for i, read in reads:
+            results[i] = list(read)
+
+        return results
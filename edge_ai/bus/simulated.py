@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import time
+from typing import Callable, List
+
+from .basebus import BaseBus
+
+
+class SimulatedBus(BaseBus):
+    """
+    In-memory register file behind the BaseBus interface, to run sensors and
+    controllers without hardware (e.g. for benchmarks).
+    With register_width=1, registers are single bytes and multi-byte
+    transfers run over consecutive addresses (AUTO_INCREMENT is ignored),
+    otherwise every transfer accesses one register of register_width bytes.
+    sources maps registers to functions returning their current value (a
+    list of register_width bytes), which are read instead of the stored one.
+    Every transaction takes at least latency seconds, spent spinning as
+    sleeps are far coarser than bus transfers.
+    """
+
+    AUTO_INCREMENT = 0x80
+
+    MAX_READ_LENGTH = 4096
+
+    def __init__(
+        self,
+        registers: dict[int, List[int]] | None = None,
+        register_width: int = 1,
+        latency: float = 0.0,
+        sources: dict[int, Callable[[], List[int]]] | None = None,
+    ) -> None:
+        super().__init__()
+
+        self._width = register_width
+        self._latency = latency
+        self._sources = dict(sources or {})
+
+        self._registers = {}
+        for register, value in (registers or {}).items():
+            self._store(register, list(value))
+
+        self.transactions = 0
+
+    def start(self) -> None:
+        pass
+
+    def stop(self) -> None:
+        pass
+
+    def peek(self, register: int) -> List[int]:
+        # Current value of a register, without a transaction
+        return self._value(register)
+
+    def poke(self, register: int, value: List[int]) -> None:
+        # Sets a register as the device would, without a transaction
+        self._store(register, list(value))
+
+    def _value(self, register: int) -> List[int]:
+        source = self._sources.get(register)
+        if source is not None:
+            return list(source())
+
+        return self._registers.get(register, [0] * self._width)
+
+    def _store(self, register: int, value: List[int]) -> None:
+        if self._width != 1:
+            self._registers[register] = value
+            return
+
+        for i, byte in enumerate(value):
+            self._registers[register + i] = [byte]
+
+    def _transaction(self) -> None:
+        self.transactions += 1
+
+        if self._latency:
+            end = time.perf_counter() + self._latency
+            while time.perf_counter() < end:
+                pass
+
+    def _address(self, register: int) -> int:
+        if self._width == 1:
+            return register & ~self.AUTO_INCREMENT
+
+        return register
+
+    def _read_register(self, register: int) -> int:
+        return self._read_register_list(register, 1)[0]
+
+    def _read_register_list(self, register: int, length: int) -> List[int]:
+        self._transaction()
+        register = self._address(register)
+
+        if self._width != 1:
+            return self._value(register)[:length]
+
+        return [self._value(register + i)[0] for i in range(length)]
+
+    def _write_register(self, register: int, value: int) -> None:
+        self._write_register_list(register, [value])
+
+    def _write_register_list(self, register: int, value: List[int]) -> None:
+        self._transaction()
+
+        self._store(self._address(register), list(value))
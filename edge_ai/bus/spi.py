@@ -1,20 +1,82 @@
 from __future__ import annotations
 
-import spidev
+import ctypes
+import fcntl
+from typing import TYPE_CHECKING
 
 from .basebus import BaseBus
 
+if TYPE_CHECKING:
+    import spidev
+
+
+class _SpiIocTransfer(ctypes.Structure):
+    # struct spi_ioc_transfer from linux/spi/spidev.h, zeroed fields use the
+    # device settings (speed, 8 bits per word)
+    _fields_ = [
+        ("tx_buf", ctypes.c_uint64),
+        ("rx_buf", ctypes.c_uint64),
+        ("len", ctypes.c_uint32),
+        ("speed_hz", ctypes.c_uint32),
+        ("delay_usecs", ctypes.c_uint16),
+        ("bits_per_word", ctypes.c_uint8),
+        ("cs_change", ctypes.c_uint8),
+        ("tx_nbits", ctypes.c_uint8),
+        ("rx_nbits", ctypes.c_uint8),
+        ("word_delay_usecs", ctypes.c_uint8),
+        ("pad", ctypes.c_uint8),
+    ]
+
 
 class SPI(BaseBus):
+    """
+    SPI bus for ST style register access: bit 7 of the address byte reads,
+    bit 6 auto-increments.
+    spidev opens and sets up the device, transfers are issued as
+    SPI_IOC_MESSAGE ioctls on preallocated transmit and receive buffers, so
+    they do not build Python lists. read_register_bytes() and readbytes()
+    return views of the receive buffer, only valid until the next transfer.
+    """
+
+    # MS bit, second bit of the address byte (the first being the read bit)
+    AUTO_INCREMENT = 0x40
+    READ = 0x80
+
+    # spidev's default transfer buffer is 4096 bytes, one of which is the address
+    MAX_READ_LENGTH = 4095
+
+    INSTRUMENTED = BaseBus.INSTRUMENTED + ("readbytes", "writebytes")
+
+    # SPI_IOC_MESSAGE(1), _IOW('k', 0, char[sizeof(struct spi_ioc_transfer)])
+    SPI_IOC_MESSAGE_1 = 0x40006B00 | ctypes.sizeof(_SpiIocTransfer) << 16
+
     def __init__(
         self, busnum: int, cs: int, maxspeed: int = 10_000_000, mode: int = 3
     ) -> None:
+        super().__init__()
+
         self._busnum = busnum
         self._cs = cs
         self._maxspeed = maxspeed
         self._mode = mode
 
         self._spi = None
+        self._fd = None
+
+        # Reused by every transfer, the ioctl reads from and writes to them
+        self._tx = bytearray(self.MAX_READ_LENGTH + 1)
+        self._rx = bytearray(self.MAX_READ_LENGTH + 1)
+        self._rx_view = memoryview(self._rx)
+
+        self._zeros = memoryview(bytes(len(self._tx)))
+
+        # ctypes views keep the buffers from being resized (and moved)
+        self._tx_c = (ctypes.c_char * len(self._tx)).from_buffer(self._tx)
+        self._rx_c = (ctypes.c_char * len(self._rx)).from_buffer(self._rx)
+
+        self._message = _SpiIocTransfer(
+            tx_buf=ctypes.addressof(self._tx_c), rx_buf=ctypes.addressof(self._rx_c)
+        )
 
     def _get_bus(self) -> spidev.SpiDev:
         if self._spi is None:
@@ -23,33 +85,81 @@ class SPI(BaseBus):
         return self._spi
 
     def start(self) -> None:
+        # only needed once the bus is opened, which keeps driver imports light
+        import spidev
+
         self._spi = spidev.SpiDev()
         self._spi.open(self._busnum, self._cs)
         self._spi.max_speed_hz = self._maxspeed
         self._spi.mode = self._mode
 
+        self._fd = self._spi.fileno()
+
     def stop(self) -> None:
         if self._spi is None:
             raise Exception("Attempted to stop bus before starting")
 
         self._spi.close()
+        self._spi = None
+        self._fd = None
+
+    def readbytes(self, length: int) -> memoryview:
+        # Clocks in length bytes while sending zeros
+        if length > len(self._rx):
+            raise Exception(f"Transfers are limited to {len(self._rx)} bytes")
+
+        self._tx[:length] = self._zeros[:length]
+
+        return self._exchange(length)
+
+    def writebytes(self, data: bytes | bytearray | memoryview) -> None:
+        if len(data) > len(self._tx):
+            raise Exception(f"Transfers are limited to {len(self._tx)} bytes")
+
+        self._tx[: len(data)] = data
+        self._exchange(len(data))
+
+    def _stats_key(self, operation: str, args: tuple) -> tuple[int | None, int]:
+        if operation == "readbytes":
+            return None, args[0]
+        elif operation == "writebytes":
+            return None, len(args[0])
+
+        return super()._stats_key(operation, args)
+
+    def _exchange(self, length: int) -> memoryview:
+        # Full duplex transfer of the first length bytes of the buffers
+        if self._fd is None:
+            self._get_bus()
+
+        self._message.len = length
+        fcntl.ioctl(self._fd, self.SPI_IOC_MESSAGE_1, self._message)
+
+        return self._rx_view[:length]
+
+    def _write_register(self, register: int, value: int) -> None:
+        self._tx[0] = register
+        self._tx[1] = value
 
-    def write_register(self, register: int, value: int) -> None:
-        to_write = [register, value]
+        self._exchange(2)
 
-        self._get_bus().xfer2(to_write)
+    def _write_register_list(self, register: int, value: list[int]) -> None:
+        self._tx[0] = register
+        self._tx[1 : 1 + len(value)] = value
 
-    def write_register_list(self, register: int, value: list[int]) -> None:
-        to_write = [register | 0x80] + value
+        self._exchange(1 + len(value))
 
-        return self._get_bus().xfer2(to_write)
+    def _read_register(self, register: int) -> int:
+        # what is sent after the address is ignored by the device
+        self._tx[0] = register | self.READ
 
-    def read_register(self, register: int) -> int:
-        to_read = [register | 0x80, 0x00]
+        return self._exchange(2)[1]
 
-        return self._get_bus().xfer2(to_read)[1]
+    def _read_register_list(self, register: int, length: int) -> list[int]:
+        return self._read_register_bytes(register, length).tolist()
 
-    def read_register_list(self, register: int, length: int) -> list[int]:
-        to_read = [register | 0x80] + [0x00] * length
+    def _read_register_bytes(self, register: int, length: int) -> memoryview:
+        self._tx[0] = register | self.READ
 
-        return self._get_bus().xfer2(to_read)
+        # first byte is clocked in while the address is sent out
+        return self._exchange(1 + length)[1:]
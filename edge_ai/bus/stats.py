@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+from typing import Any
+
+
+class Counter:
+    """
+    Transactions, bytes and time spent for one kind of bus access.
+    histogram[i] counts transactions that took 2**i to 2**(i + 1) us,
+    histogram[0] also counting the ones under 1 us.
+    """
+
+    BUCKETS = 24
+
+    __slots__ = ("count", "bytes", "total_ns", "max_ns", "histogram")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.bytes = 0
+        self.total_ns = 0
+        self.max_ns = 0
+        self.histogram = [0] * self.BUCKETS
+
+    def add(self, nbytes: int, elapsed_ns: int) -> None:
+        self.count += 1
+        self.bytes += nbytes
+        self.total_ns += elapsed_ns
+        if elapsed_ns > self.max_ns:
+            self.max_ns = elapsed_ns
+
+        bucket = (elapsed_ns // 1000).bit_length() - 1
+        self.histogram[min(max(bucket, 0), self.BUCKETS - 1)] += 1
+
+    def as_dict(self, bus_time_ns: int) -> dict[str, Any]:
+        return {
+            "count": self.count,
+            "bytes": self.bytes,
+            "total_ns": self.total_ns,
+            "mean_ns": self.total_ns / self.count if self.count else None,
+            "max_ns": self.max_ns,
+            # fraction of all the time spent on the bus
+            "share": self.total_ns / bus_time_ns if bus_time_ns else 0.0,
+            "histogram_us": self.histogram,
+        }
+
+
+class BusStats:
+    """
+    Counters of the transactions a bus issued to its device, per operation
+    (e.g. "read_register_list") and per operation and register. as_dict()
+    returns plain types, so the result can be sent through a pipe or
+    written out as JSON.
+    """
+
+    def __init__(self) -> None:
+        self.operations = {}
+        self.registers = {}
+
+    def record(
+        self, operation: str, register: int | None, nbytes: int, elapsed_ns: int
+    ) -> None:
+        counter = self.operations.get(operation)
+        if counter is None:
+            counter = self.operations[operation] = Counter()
+        counter.add(nbytes, elapsed_ns)
+
+        if register is None:
+            return
+
+        key = (operation, register)
+        counter = self.registers.get(key)
+        if counter is None:
+            counter = self.registers[key] = Counter()
+        counter.add(nbytes, elapsed_ns)
+
+    def as_dict(self) -> dict[str, Any]:
+        bus_time_ns = sum(counter.total_ns for counter in self.operations.values())
+
+        return {
+            "bus_time_ns": bus_time_ns,
+            "operations": {
+                operation: counter.as_dict(bus_time_ns)
+                for operation, counter in self.operations.items()
+            },
+            "registers": {
+                f"{operation} 0x{register:02X}": counter.as_dict(bus_time_ns)
+                for (operation, register), counter in sorted(self.registers.items())
+            },
+        }
@@ -1,15 +1,41 @@
 from __future__ import annotations
 
-import datetime
 import time
 from multiprocessing.connection import Connection
+from typing import Iterator
+
+import numpy as np
 
 import edge_ai.sensor as sensor
 
+from ...bus import BaseBus
 from ..basecontroller import BaseController
+from ..capture import Capture
+from ..circularbuffer import CircularBuffer
 
 
 class LIS3DH(BaseController):
+    """
+    Controller for the LIS3DH accelerometer.
+    With use_circular_buffer(), the subprocess captures continuously into a
+    circular buffer of the latest samples, and read_around() copies out a
+    window around a point in time (e.g. a trigger), including samples from
+    before the request was made.
+    Overruns reported in capture metadata are the frames read with ZYXOR set
+    when polling or woken up by the data ready line, and FIFO overruns when
+    draining the FIFO.
+    """
+
+    # read_for drains the hardware FIFO instead of polling for every sample at
+    # or above this output data rate
+    FIFO_DATARATE = 400
+    FIFO_WATERMARK = 16
+
+    # samples stored at a time when filling the circular buffer
+    HISTORY_BATCH = 32
+
+    RECORD_DTYPE = np.dtype([("time", "<i8"), ("x", "<f4"), ("y", "<f4"), ("z", "<f4")])
+
     def __init__(self, interface: str, busconfig: dict[str, int]) -> None:
         super().__init__()
 
@@ -25,6 +51,20 @@ class LIS3DH(BaseController):
         self._x = True
         self._y = True
         self._z = True
+        self._fifo = None  # None: use the FIFO at or above FIFO_DATARATE
+
+        # FIFO overruns seen during the last read_for, and the sensor's count
+        # of ZYXOR frames as of the last check
+        self._fifo_overruns = 0
+        self._frame_overruns = 0
+
+        # seconds of samples kept by the subprocess, see use_circular_buffer
+        self._history_length = None
+        self._history = None
+
+        # newest sample of the FIFO capture or history running, if any, which
+        # "read" is answered with so as not to take samples away from it
+        self._latest = None
 
     @staticmethod
     def SPI(busnum: int, cs: int, maxspeed: int = 10_000_000, mode: int = 3) -> LIS3DH:
@@ -38,6 +78,13 @@ class LIS3DH(BaseController):
         controller = LIS3DH("i2c", busconfig)
         return controller
 
+    @staticmethod
+    def Simulated(bus: BaseBus) -> LIS3DH:
+        # Runs the sensor on a bus object, e.g. a SimulatedBus
+        busconfig = {"bus": bus}
+        controller = LIS3DH("simulated", busconfig)
+        return controller
+
     def set_measurement_range(self, measurement_range: int) -> None:
         if measurement_range not in sensor.accel.LIS3DH.MEASUREMENT_RANGES:
             raise Exception(
@@ -73,42 +120,250 @@ class LIS3DH(BaseController):
     def enable_highpass(self, highpass: bool = True) -> None:
         self._highpass = highpass
 
-    def read_for(
-        self, seconds: float = 0, timeformat: str = "%Y-%m-%d %H:%M:%S.%f"
-    ) -> list[tuple[str, list[float]]]:
-        self._external_pipe.send(("read for", seconds, timeformat))
+    def use_fifo(self, enabled: bool | None = True) -> None:
+        # None picks the FIFO automatically based on the data rate
+        self._fifo = enabled
+
+    def fifo_overruns(self) -> int:
+        return self._request(("fifo overruns",))
+
+    def use_circular_buffer(self, seconds: float) -> None:
+        if self._process.is_alive():
+            raise Exception("Circular buffer must be set up before starting")
+
+        self._history_length = seconds
+
+    def read_around(
+        self, timestamp: int, before: float, after: float, chunk_size: int = 1024
+    ) -> Capture:
+        # Samples from before seconds before to after seconds after a
+        # monotonic time in ns, waiting until the latter has passed
+        if self._history_length is None:
+            raise Exception("read_around needs use_circular_buffer")
+
+        self._external_pipe.send(
+            (
+                "read around",
+                timestamp - int(before * 1e9),
+                timestamp + int(after * 1e9),
+                self._limit_chunk_size(chunk_size),
+            )
+        )
 
-        return self._external_pipe.recv()
+        return self._collect(self._receive_stream())
 
     def enable_axes(self, x: bool = True, y: bool = True, z: bool = True) -> None:
         self._x = x
         self._y = y
         self._z = z
 
-    def _read_for(
-        self, seconds: float, timeformat: str
-    ) -> list[tuple[str, list[float]]]:
-        start = time.time()
-
-        results = []
+    def _configured_datarate(self) -> float | None:
+        return self._datarate
+
+    def _discard_stale_frame(self) -> None:
+        # The frame left from before the capture reports an overrun if it sat
+        # unread for more than a sample, which is no loss within the capture
+        self._sensor.read_new_data()
+        self._frame_overruns = self._sensor.overruns
 
-        while time.time() < start + seconds:
-            if self._sensor.new_data_available():
-                results.append(
-                    (f"{datetime.datetime.now():{timeformat}}", self._sensor.read())
-                )
+    def _check_overruns(self) -> None:
+        # Records the frames the sensor read with ZYXOR set since the last check
+        while self._frame_overruns < self._sensor.overruns:
+            self._record_overrun()
+            self._frame_overruns += 1
+
+    def _fifo_enabled(self) -> bool:
+        if self._fifo is None:
+            return self._datarate >= self.FIFO_DATARATE
+
+        return self._fifo
+
+    def _capture(self, seconds: float) -> Iterator[tuple[int, list[float]] | float]:
+        if self._fifo_enabled():
+            yield from self._capture_fifo(seconds)
+            return
+
+        if self._ready_line is not None:
+            yield from self._capture_interrupt(seconds)
+            return
+
+        period = 1 / self._datarate
+        self._discard_stale_frame()
+
+        end = time.monotonic() + seconds
+
+        while time.monotonic() < end:
+            values = self._sensor.read_new_data()
+            self._check_overruns()
+
+            if values is not None:
+                yield (time.monotonic_ns(), values)
+            else:
+                # check again a fraction of a sample period later
+                yield time.monotonic() + period / 4
+
+    def _capture_interrupt(
+        self, seconds: float
+    ) -> Iterator[tuple[int, list[float]] | float]:
+        period = 1 / self._datarate
+
+        self._sensor.set_interrupt1(data_ready=True)
+
+        # edges and data from before the capture are stale
+        self._ready_line.read_events()
+        self._discard_stale_frame()
+
+        end = time.monotonic() + seconds
+
+        try:
+            while time.monotonic() < end:
+                # woken up by the next edge, or two periods later if one was missed
+                yield time.monotonic() + 2 * period
+
+                events = self._ready_line.read_events()
+                if events:
+                    values = self._sensor.read()
+                    self._check_overruns()
+
+                    yield (events[-1], values)
+                else:
+                    values = self._sensor.read_new_data()
+                    self._check_overruns()
+
+                    if values is not None:
+                        yield (time.monotonic_ns(), values)
+        finally:
+            self._sensor.set_interrupt1()
+
+    def _capture_fifo(
+        self, seconds: float
+    ) -> Iterator[tuple[int, list[float]] | float]:
+        period = 1 / self._datarate
+        period_ns = 1_000_000_000 // self._datarate
+
+        # Without a data ready line, wake up around when the watermark is
+        # reached, otherwise the watermark interrupt wakes us up
+        interval = self.FIFO_WATERMARK * period
+        if self._ready_line is not None:
+            self._sensor.set_interrupt1(fifo_watermark=True)
+            interval *= 2
+
+        self._sensor.enable_fifo("stream", self.FIFO_WATERMARK)
+        self._fifo_overruns = 0
+
+        # timestamp of the last sample yielded
+        last = 0
+
+        end = time.monotonic() + seconds
+
+        try:
+            while time.monotonic() < end:
+                if self._ready_line is not None:
+                    self._ready_line.read_events()
+
+                samples, overrun = self._sensor.read_fifo()
+                now = time.monotonic_ns()
+
+                if overrun:
+                    self._fifo_overruns += 1
+                    self._record_overrun(now)
+
+                # Samples were taken at the data rate, the newest one just now.
+                # When reads jitter, or the ODR runs fast, a batch
+                # back-computed that way overlaps the previous one, so it is
+                # spread evenly between the previous one and now instead.
+                first = now - (len(samples) - 1) * period_ns
+                if first > last:
+                    timestamps = [first + i * period_ns for i in range(len(samples))]
+                else:
+                    timestamps = [
+                        last + (i + 1) * (now - last) // len(samples)
+                        for i in range(len(samples))
+                    ]
+
+                for last, values in zip(timestamps, samples.tolist()):
+                    self._latest = values
+                    yield (last, values)
+
+                # Let the FIFO fill back up to the watermark
+                yield time.monotonic() + interval
+        finally:
+            self._latest = None
+            self._sensor.disable_fifo()
+
+            if self._ready_line is not None:
+                self._sensor.set_interrupt1()
+
+    def _background_task(self) -> Iterator[float] | None:
+        if self._history_length is None:
+            return None
+
+        capacity = int(self._history_length * self._datarate)
+        self._history = CircularBuffer(self.RECORD_DTYPE, capacity)
+
+        return self._fill_history()
+
+    def _fill_history(self) -> Iterator[float]:
+        # Runs the capture for good, storing what it yields in batches. Hands
+        # control back at every wait, and after a full batch if it never waits.
+        samples = []
+        for sample in self._capture(float("inf")):
+            if not isinstance(sample, float):
+                samples.append(sample)
+                self._latest = sample[1]
+
+                if len(samples) < self.HISTORY_BATCH:
+                    continue
+
+                sample = time.monotonic()
+
+            if samples:
+                timestamps = np.array([timestamp for timestamp, _ in samples])
+                values = np.array([values for _, values in samples])
+                self._history.append(self._to_records(timestamps, values))
+                samples = []
+
+            yield sample
+
+    def _window_task(
+        self, pipe: Connection, start: int, stop: int, chunk_size: int
+    ) -> Iterator[float]:
+        # Sent like _stream_task, once the buffer has caught up with stop
+        pipe.send(("start", (time.time_ns(), time.monotonic_ns())))
+
+        # samples are stored up to a sample (a watermark with the FIFO) late
+        interval = 1 / self._datarate
+        if self._fifo_enabled():
+            interval *= self.FIFO_WATERMARK
+        deadline = stop / 1e9 + max(interval, 0.1)
+
+        while self._history.latest is None or self._history.latest < stop:
+            if time.monotonic() > deadline:
+                break
+
+            yield max(stop / 1e9, time.monotonic() + interval)
+
+        records = self._history.between(start, stop)
+        for i in range(0, len(records), chunk_size):
+            self._send_records(pipe, records[i : i + chunk_size])
 
-        return results
+        pipe.send(("end", self._window_summary(start, stop)))
 
     def _initialize_sensor(self) -> sensor.accel.LIS3DH:
         if self._interface == "spi":
             return sensor.accel.LIS3DH.SPI(**self._busconfig)
         elif self._interface == "i2c":
             return sensor.accel.LIS3DH.I2C(**self._busconfig)
+        elif self._interface == "simulated":
+            return sensor.accel.LIS3DH(self._busconfig["bus"])
         else:
-            raise Exception("Mode must be spi or i2c")
+            raise Exception("Mode must be spi, i2c or simulated")
 
     def _configure_sensor(self) -> None:
+        self._sensor.set_datarate(5376)
+        self._sensor.enable_axes()
+        self._sensor.set_selftest("off")
+
         self._sensor.set_resolution(self._resolution)
         self._sensor.set_datarate(self._datarate)
         self._sensor.set_measurement_range(self._measurement_range)
@@ -116,25 +371,19 @@ class LIS3DH(BaseController):
         self._sensor.set_selftest(self._selftest)
         self._sensor.enable_highpass(self._highpass)
 
-    def _internal_loop(self, pipe: Connection) -> None:
-        # this is a loop that manages the running of the sensor.
-
-        # Initialize Sensor
-        self._sensor = self._initialize_sensor()
-
-        # Write any settings, config, etc
-        self._sensor.set_datarate(5376)
-        self._sensor.enable_axes()
-        self._sensor.set_selftest("off")
-        self._configure_sensor()
-
-        while True:
-            # poll the pipe
-            if pipe.poll():
-                message = pipe.recv()
-
-                # if pipe says "read", send out the data into the pipe
-                if message[0] == "read":
-                    pipe.send(self._sensor.read())
-                elif message[0] == "read for":
-                    pipe.send(self._read_for(message[1], message[2]))
+    def _handle_message(self, pipe: Connection, message: tuple) -> None:
+        if message[0] == "fifo overruns":
+            pipe.send(self._fifo_overruns)
+        elif message[0] == "read" and self._latest is not None:
+            # reading the sensor would pop a sample from the FIFO, or clear
+            # the new data flag the history polls for
+            pipe.send(self._latest)
+        elif self._history is not None and message[0] == "read around":
+            self._task = self._window_task(pipe, *message[1:])
+        elif self._history is not None and message[0] == "stream for":
+            # the sensor is already being captured, serve it from the buffer
+            start = time.monotonic_ns()
+            stop = start + int(message[1] * 1e9)
+            self._task = self._window_task(pipe, start, stop, message[2])
+        else:
+            super()._handle_message(pipe, message)
@@ -1,91 +1,105 @@
 from __future__ import annotations
 
+import multiprocessing as mp
+import select
+import time
+from collections import deque
 from multiprocessing.connection import Connection
+from typing import Iterable, Iterator
+
+import numpy as np
 
 import edge_ai.sensor as sensor
 
+from ...bus import BaseBus
 from ..basecontroller import BaseController
+from ..capture import Capture
 
 
 class ADS1015(BaseController):
+    RECORD_DTYPE = np.dtype([("time", "<i8"), ("voltage", "<f4")])
+
+    # trigger events kept by the subprocess while the pipe is full, the
+    # oldest are dropped beyond that
+    TRIGGER_BACKLOG = 1024
+
     def __init__(self, mode: str, busconfig: dict[str, int]) -> None:
         super().__init__()
         self._mode = mode
         self._busconfig = busconfig
 
-        # Default values
-        self._continuous = True
-        self._diff_channel1 = 0
-        self._diff_channel2 = 1
-        self._single_channel = 0
-        self._diffmode = True
-        self._datarange = 2.048
-        self._data_rate = 1600
-        self._comp_mode_traditional = True
-        self._comp_polarity = 0
-        self._comp_latch = False
-        self._comp_queue_length = 0
+        # Default values, written to the config register in one go
+        self._config = sensor.adc.ADS1015Config(continuous=True)
         self._lo_thresh = 0x800
         self._hi_thresh = 0x7FF
 
+        # (threshold, hysteresis) in V, see set_trigger
+        self._trigger = None
+        self._trigger_events, self._internal_trigger_events = mp.Pipe(False)
+        self._pending_triggers = deque(maxlen=self.TRIGGER_BACKLOG)
+
     @staticmethod
     def I2C(address: int, busnum: int) -> ADS1015:
         busconfig = {"address": address, "busnum": busnum}
         controller = ADS1015("i2c", busconfig)
         return controller
 
+    @staticmethod
+    def Simulated(bus: BaseBus) -> ADS1015:
+        # Runs the sensor on a bus object, e.g. a SimulatedBus
+        busconfig = {"bus": bus}
+        controller = ADS1015("simulated", busconfig)
+        return controller
+
     # External API
     # OS Bit: Read/Write status, continuous or singleshot controls
     def new_data_available(self) -> bool:
-        self._external_pipe.send(["new_data_available"])
-
-        return self._external_pipe.recv()
+        return self._request(("new data available",))
 
     def set_continuous(self) -> None:
-        self._continuous = True
+        self._config = self._config.replace(continuous=True)
 
     def set_singleshot(self) -> None:
-        self._continuous = False
+        self._config = self._config.replace(continuous=False)
 
     # MUX bit: set multiplexer state (which channels are to be used)
     def set_differential_mode(self, channel1: int = 0, channel2: int = 1) -> None:
-        self._diff_channel1 = channel1
-        self._diff_channel2 = channel2
-
-        self._diffmode = True
+        self._config = self._config.replace(mux=(channel1, channel2))
 
     def set_single_channel(self, channel: int = 0) -> None:
-        self._single_channel = channel
-
-        self._diffmode = False
+        self._config = self._config.replace(mux=channel)
 
     # PGA bit: set full data range
     def set_data_range(self, full_scale_range: float = 2.048) -> None:
-        self._datarange = full_scale_range
+        self._config = self._config.replace(full_range=full_scale_range)
 
     # DR bits: set data rate in SPS
     def set_data_rate(self, data_rate: int = 1600) -> None:
-        self._data_rate = data_rate
+        self._config = self._config.replace(data_rate=data_rate)
 
     # COMP_MODE bits: sets the comparator mode
     def set_comp_mode_traditional(self) -> None:
-        self._comp_mode_traditional = True
+        self._config = self._config.replace(comp_window=False)
 
     def set_comp_mode_window(self) -> None:
-        self._comp_mode_traditional = False
+        self._config = self._config.replace(comp_window=True)
 
     # COMP_POL bit: sets the ppolarity of the ALERT/RDY pin
     def set_alert_ready_polarity(self, polarity=0) -> None:
-        self._comp_polarity = polarity
+        self._config = self._config.replace(comp_polarity=polarity)
 
     # COMP_LAT bit: sets the comparator alter pin to latching mode
     def enable_latching_comparator(self, latch=True) -> None:
-        self._comp_latch = latch
+        self._config = self._config.replace(comp_latch=latch)
 
     # COMP_QUE bits: sets the number of consecutive conversions past the
     #   threshold before triggering the ALERT/RDY pin
     def set_comparator_queue(self, length=0) -> None:
-        self._comp_queue_length = length
+        self._config = self._config.replace(comp_queue=length)
+
+    # Whole config register at once
+    def configure(self, config: sensor.adc.ADS1015Config) -> None:
+        self._config = config
 
     # Lo and Hi_thresh registers: sets the low or high thresh register values
     def set_lo_thresh(self, value=0x800) -> None:
@@ -94,51 +108,198 @@ class ADS1015(BaseController):
     def set_hi_thresh(self, value=0x7FF) -> None:
         self._hi_thresh = value
 
-    # Internal methods
-    def _initialize_sensor(self) -> sensor.adc.ADS1015:
-        return sensor.adc.ADS1015.I2C(**self._busconfig)
+    # Trigger: evaluated in the subprocess at the data rate
+    def set_trigger(self, threshold: float, hysteresis: float = 0.0) -> None:
+        # Fires once when the reading rises above threshold, and is armed
+        # again once it has fallen below threshold - hysteresis
+        if self._process.is_alive():
+            raise Exception("Trigger must be set up before starting")
+
+        self._trigger = (threshold, hysteresis)
+
+    def wait_for_trigger(self, timeout: float | None = None) -> int | None:
+        # Monotonic time (ns) of the conversion that fired the trigger, None
+        # on timeout
+        if not self._trigger_events.poll(timeout):
+            return None
+
+        return self._trigger_events.recv()
+
+    @property
+    def trigger_events(self) -> Connection:
+        # Receiving end of the trigger events, can be waited on with other
+        # connections or handed to another process
+        return self._trigger_events
+
+    # Scan: round-robin single-shot conversions over single-ended channels
+    def scan_for(
+        self, seconds: float, channels: Iterable[int], chunk_size: int = 1024
+    ) -> dict[int, Capture]:
+        # Converts every channel in turn, each as fast as the data rate
+        # safely allows, for seconds. Returns channel -> samples.
+        channels = list(channels)
+        for channel in channels:
+            if channel not in sensor.adc.ADS1015.CH_SINGLE:
+                raise Exception(
+                    f"Channel must be one of: {', '.join(str(ch) for ch in sensor.adc.ADS1015.CH_SINGLE)}"
+                )
+
+        if self._trigger is not None:
+            # the trigger reads the conversion register in between
+            raise Exception("Scan mode cannot be used along with a trigger")
+
+        self._external_pipe.send(
+            ("scan for", seconds, channels, self._limit_chunk_size(chunk_size))
+        )
+        capture = self._collect(self._receive_stream())
+
+        # _scan only sends complete rounds, in channel order
+        return {
+            channel: Capture(
+                capture.timestamps[i :: len(channels)].copy(),
+                capture.values[i :: len(channels)].copy(),
+                capture.anchor,
+            )
+            for i, channel in enumerate(channels)
+        }
 
-    def _configure_sensor(self) -> None:
-        self._sensor.set_data_range(self._datarange)
-        self._sensor.set_data_rate(self._data_rate)
-        self._sensor.set_alert_ready_polarity(self._comp_polarity)
-        self._sensor.set_comparator_queue(self._comp_queue_length)
-        self._sensor.enable_latching_comparator(self._comp_latch)
-        self._sensor.set_lo_thresh(self._lo_thresh)
-        self._sensor.set_hi_thresh(self._hi_thresh)
+    # Internal methods
+    def _configured_datarate(self) -> float | None:
+        return self._config.data_rate
 
-        if self._diffmode:
-            self._sensor.set_differential_mode(self._diff_channel1, self._diff_channel2)
-        else:
-            self._sensor.set_single_channel(self._single_channel)
+    def _background_task(self) -> Iterator[float] | None:
+        if self._trigger is None:
+            return None
 
-        if self._comp_mode_traditional:
-            self._sensor.set_comp_mode_traditional()
-        else:
-            self._sensor.set_comp_mode_window()
+        return self._watch_trigger(*self._trigger)
 
-        if self._continuous:
-            self._sensor.start_continuous()
-        else:
-            self._sensor.start_singleshot()
+    def _watch_trigger(self, threshold: float, hysteresis: float) -> Iterator[float]:
+        period = 1 / self._config.data_rate
+        armed = True
 
-    def _internal_loop(self, pipe: Connection) -> None:
-        # this is a loop that manages the running of the sensor.
+        next_sample = time.monotonic()
+        while True:
+            # always hands control back, so requests get answered in between
+            yield next_sample
+
+            value = self._sensor.read()
+            timestamp = time.monotonic_ns()
+
+            if armed and value > threshold:
+                self._pending_triggers.append(timestamp)
+                armed = False
+            elif value < threshold - hysteresis:
+                armed = True
+
+            self._send_triggers()
+
+            next_sample = max(next_sample + period, time.monotonic() - period)
+
+    def _send_triggers(self) -> None:
+        # Only sends while the pipe has room for a message (select reports a
+        # pipe writable with PIPE_BUF bytes free), so a parent that is not
+        # taking events cannot block the subprocess and the other sensors
+        while (
+            self._pending_triggers
+            and select.select([], [self._internal_trigger_events], [], 0)[1]
+        ):
+            self._internal_trigger_events.send(self._pending_triggers.popleft())
+
+    def _capture(self, seconds: float) -> Iterator[tuple[int, float] | float]:
+        if self._ready_line is not None:
+            yield from self._capture_interrupt(seconds)
+            return
+
+        # Conversions complete at the data rate, so read on that schedule
+        period = 1 / self._config.data_rate
+
+        next_sample = time.monotonic()
+        end = next_sample + seconds
+
+        while next_sample < end:
+            if next_sample > time.monotonic():
+                yield next_sample
+
+            yield (time.monotonic_ns(), self._sensor.read())
+
+            next_sample = max(next_sample + period, time.monotonic() - period)
+
+    def _scan(
+        self, seconds: float, channels: list[int]
+    ) -> Iterator[tuple[int, float] | float]:
+        # Each conversion is read once it is guaranteed to be done, in the
+        # same bus transaction that starts the next one, and stamped with
+        # its midpoint
+        conversion = self._sensor.conversion_time()
+        conversion_ns = int(conversion * 1e9)
+
+        end = time.monotonic() + seconds
+
+        with self._sensor.preserved_config():
+            self._sensor.start_single_conversion(channels[0])
+
+            finished = False
+            while not finished:
+                for i in range(len(channels)):
+                    midpoint = time.monotonic_ns() + conversion_ns // 2
+
+                    yield time.monotonic() + conversion
+
+                    # only complete rounds are sent
+                    finished = i == len(channels) - 1 and time.monotonic() >= end
+                    if finished:
+                        value = self._sensor.read()
+                    else:
+                        value = self._sensor.read_and_start_conversion(
+                            channels[(i + 1) % len(channels)]
+                        )
+
+                    yield (midpoint, value)
+
+    def _capture_interrupt(self, seconds: float) -> Iterator[tuple[int, float] | float]:
+        # ALERT/RDY pulses at the end of every conversion
+        period = 1 / self._config.data_rate
+
+        self._sensor.enable_conversion_ready_pin()
+
+        # edges from before the capture are stale
+        self._ready_line.read_events()
+
+        end = time.monotonic() + seconds
+
+        try:
+            while time.monotonic() < end:
+                # woken up by the next edge, or two periods later if one was missed
+                yield time.monotonic() + 2 * period
+
+                events = self._ready_line.read_events()
+                if events:
+                    yield (events[-1], self._sensor.read())
+                else:
+                    yield (time.monotonic_ns(), self._sensor.read())
+        finally:
+            # back to the configured comparator
+            self._sensor.set_lo_thresh(self._lo_thresh)
+            self._sensor.set_hi_thresh(self._hi_thresh)
+            self._sensor.configure(self._config)
 
-        # Initialize Sensor
-        self._sensor = self._initialize_sensor()
+    def _initialize_sensor(self) -> sensor.adc.ADS1015:
+        if self._mode == "simulated":
+            return sensor.adc.ADS1015(self._busconfig["bus"])
 
-        # Write any settings, config, etc
-        self._configure_sensor()
+        return sensor.adc.ADS1015.I2C(**self._busconfig)
 
-        # TODO: add more control over which are read/etc
-        while True:
-            # poll the pipe
-            if pipe.poll():
-                message = pipe.recv()
-
-                # if pipe says "read", send out the data into the pipe
-                if message[0] == "read":
-                    pipe.send(self._sensor.read())
-                elif message[0] == "new data available":
-                    pipe.send(self._sensor.new_data_available())
+    def _configure_sensor(self) -> None:
+        self._sensor.set_lo_thresh(self._lo_thresh)
+        self._sensor.set_hi_thresh(self._hi_thresh)
+        self._sensor.configure(self._config, start=True)
+
+    def _handle_message(self, pipe: Connection, message: tuple) -> None:
+        if message[0] == "new data available":
+            pipe.send(self._sensor.new_data_available())
+        elif message[0] == "scan for":
+            self._task = self._stream_task(
+                pipe, self._scan(message[1], message[2]), message[3]
+            )
+        else:
+            super()._handle_message(pipe, message)
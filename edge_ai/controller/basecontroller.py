@@ -1,7 +1,18 @@
+from __future__ import annotations
+
 import multiprocessing as mp
+import time
 from abc import ABC, abstractmethod
-from multiprocessing.connection import Connection
-from typing import Any
+from collections import deque
+from multiprocessing.connection import Connection, wait
+from typing import Any, Iterable, Iterator
+
+import numpy as np
+from numpy.lib.recfunctions import structured_to_unstructured
+
+from ..gpio import BaseLine
+from .capture import Capture
+from .ringbuffer import RingBuffer
 
 
 class BaseController(ABC):
@@ -9,29 +20,454 @@ class BaseController(ABC):
     Base class for Sensor Controllers.
     Controllers run sensors in a separate subprocess, and communicate with them
     via pipe.
+    Captured samples either travel through the pipe, or, with
+    use_shared_memory(), through a shared memory ring buffer of RECORD_DTYPE
+    records while the pipe only carries the cursors.
+
+    The subprocess sleeps in a wait on the pipe. Requests that span time
+    (read_for, stream_for) run as tasks: generators that do some work and
+    yield the monotonic time they next need to run at, so the subprocess
+    sleeps between samples rather than spinning. Capture generators yield
+    (time.monotonic_ns(), values) samples, or a float deadline when they
+    have to wait. The pipe stays in the wait while a task runs: other
+    requests (read, bus_stats, ...) are answered in between samples, and a
+    second task only starts once the first one is done. Their replies can
+    arrive in the middle of a stream, so stream messages received while
+    waiting for a reply are kept for the stream.
+    With use_data_ready_line(), an edge on the sensor's data-ready line also
+    wakes the task up, so samples are read as soon as they are ready.
+    With use_bus_stats(), the subprocess counts the sensor's bus
+    transactions, and bus_stats() fetches the counters over the pipe.
+    Captures record the sensor overruns (samples lost because the sensor
+    was not read in time) seen while they ran, which read_for reports in
+    the capture's metadata along with the achieved rate.
+    Subclasses can also return a background task from _background_task(),
+    which runs alongside requests for as long as the subprocess does.
     """
 
+    # Fixed-width record for one captured sample: "time" (monotonic ns) first,
+    # then one field per value, all of the same type
+    RECORD_DTYPE = np.dtype([("time", "<i8")])
+
+    # overrun times kept by the subprocess, to count the ones during a window
+    OVERRUN_HISTORY = 4096
+
+    # first element of the messages a task streams, replies are anything else
+    STREAM_MESSAGES = ("start", "chunk", "end")
+
     def __init__(self) -> None:
         self._external_pipe, self._internal_pipe = mp.Pipe(True)
         self._process = mp.Process(
             target=self._internal_loop, args=(self._internal_pipe,), daemon=True
         )
 
+        self._ring = None
+        self._ready_line = None
+        self._bus_stats = False
+
+        # Monotonic ns of the overruns seen in the subprocess, and what the
+        # subprocess reported about the latest window (sent with "end")
+        self._overruns = deque(maxlen=self.OVERRUN_HISTORY)
+        self._window_info = {}
+
+        # stream messages received while waiting for the reply to a request
+        self._stream_backlog = deque()
+
+        # wall clock anchor of the latest window
+        self._last_anchor = (time.time_ns(), time.monotonic_ns())
+
+        # Request being worked on in the subprocess, and the background task,
+        # with the monotonic times they are due again at, see _service
+        self._task = None
+        self._task_due = 0.0
+        self._background = None
+        self._background_due = 0.0
+
+        # set by AcquisitionEngine.add, which then runs the subprocess
+        self._engine = None
+
     def start(self) -> None:
+        if self._engine is not None:
+            raise Exception("Controller is run by an acquisition engine, start it")
+
         self._process.start()
 
     def stop(self) -> None:
+        if self._engine is not None:
+            raise Exception("Controller is run by an acquisition engine, stop it")
+
         if not self._process.is_alive():
             raise Exception("Attempted to stop controller before starting")
 
         # close running process
         self._process.kill()
 
+        self._release()
+
+    def _release(self) -> None:
+        # Frees what the controller holds in the parent process
+        if self._ring is not None:
+            self._ring.close()
+            self._ring.unlink()
+
+    def use_shared_memory(self, capacity: int = 65536) -> None:
+        if self._process.is_alive():
+            raise Exception("Shared memory must be set up before starting")
+
+        self._ring = RingBuffer(self.RECORD_DTYPE, capacity)
+
+    def use_data_ready_line(self, line: BaseLine) -> None:
+        # line is started in the subprocess
+        if self._process.is_alive():
+            raise Exception("Data ready line must be set up before starting")
+
+        self._ready_line = line
+
+    def use_bus_stats(self) -> None:
+        if self._process.is_alive():
+            raise Exception("Bus stats must be set up before starting")
+
+        self._bus_stats = True
+
+    def bus_stats(self, reset: bool = False) -> dict[str, Any] | None:
+        # Counters of the transactions on the sensor's bus since it started
+        # (or the last reset), None without use_bus_stats()
+        return self._request(("bus stats", reset))
+
     def read(self) -> Any:
-        self._external_pipe.send(("read",))
+        return self._request(("read",))
+
+    def _request(self, message: tuple) -> Any:
+        # Sends a request answered with a single reply, keeping the messages
+        # of a stream still running for _receive_stream
+        self._external_pipe.send(message)
+
+        while True:
+            reply = self._external_pipe.recv()
+            if not self._is_stream_message(reply):
+                return reply
+
+            self._stream_backlog.append(reply)
+
+    def _is_stream_message(self, message: Any) -> bool:
+        return (
+            isinstance(message, tuple)
+            and len(message) > 0
+            and message[0] in self.STREAM_MESSAGES
+        )
+
+    def _next_stream_message(self) -> tuple:
+        if self._stream_backlog:
+            return self._stream_backlog.popleft()
 
         return self._external_pipe.recv()
 
-    @abstractmethod
+    def read_for(self, seconds: float = 0) -> Capture:
+        return self._collect(self.stream_for(seconds))
+
+    def stream_for(
+        self, seconds: float = 0, chunk_size: int = 1024
+    ) -> Iterator[Capture]:
+        # Same samples as read_for, but handed over in chunks of up to
+        # chunk_size as soon as they are captured.
+        self._external_pipe.send(
+            ("stream for", seconds, self._limit_chunk_size(chunk_size))
+        )
+
+        return self._receive_stream()
+
+    def _limit_chunk_size(self, chunk_size: int) -> int:
+        if self._ring is not None:
+            # leave room for the next chunk while the caller holds the current one
+            chunk_size = min(chunk_size, self._ring.capacity // 2)
+
+        return chunk_size
+
+    def _collect(self, stream: Iterator[Capture]) -> Capture:
+        chunks = [chunk.copy() for chunk in stream]
+        if not chunks:
+            capture = Capture(
+                np.empty(0, dtype=np.int64), self._empty_values(), self._last_anchor
+            )
+        else:
+            capture = Capture.concatenate(chunks)
+
+        capture.metadata = {
+            "datarate": self._configured_datarate(),
+            "achieved_rate": capture.achieved_rate(),
+            "overruns": self._window_info.get("overruns", 0),
+            "max_gap": capture.max_gap(),
+        }
+
+        return capture
+
+    def _configured_datarate(self) -> float | None:
+        # Samples per second the sensor is set up to produce
+        return None
+
+    def _receive_stream(self) -> Iterator[Capture]:
+        # Yields the chunks sent by _stream_task as they arrive. With shared
+        # memory, they are views into the ring buffer, only valid until the
+        # next chunk is requested.
+        anchor = self._next_stream_message()[1]
+        self._last_anchor = anchor
+
+        finished = False
+        try:
+            while not finished:
+                message = self._next_stream_message()
+                if message[0] == "end":
+                    self._window_info = message[1]
+                    finished = True
+                elif self._ring is None:
+                    yield Capture(message[1], message[2], anchor)
+                else:
+                    yield self._records_to_capture(
+                        self._ring.read(message[1], message[2]), anchor
+                    )
+
+                    # the caller is done with the previous view
+                    self._ring.release(message[2])
+        finally:
+            # If the caller stopped early, discard the rest of the stream so the
+            # next reply on the pipe belongs to the next request
+            while not finished:
+                message = self._next_stream_message()
+                finished = message[0] == "end"
+
+                if finished:
+                    self._window_info = message[1]
+                elif self._ring is not None:
+                    self._ring.release(message[2])
+
+            if self._ring is not None:
+                self._ring.release(self._ring.write_cursor)
+
+    def _records_to_capture(
+        self, records: np.ndarray, anchor: tuple[int, int]
+    ) -> Capture:
+        fields = self.RECORD_DTYPE.names[1:]
+
+        if len(fields) == 1:
+            values = records[fields[0]]
+        else:
+            values = structured_to_unstructured(records[list(fields)])
+
+        return Capture(records["time"], values, anchor)
+
+    def _empty_values(self) -> np.ndarray:
+        fields = self.RECORD_DTYPE.names[1:]
+        shape = (0,) if len(fields) == 1 else (0, len(fields))
+
+        return np.empty(shape, dtype=self.RECORD_DTYPE[1])
+
+    def _stream_task(
+        self,
+        pipe: Connection,
+        samples: Iterable[tuple[int, Any] | float],
+        chunk_size: int,
+    ) -> Iterator[float]:
+        # Wall clock is read once per window, samples only carry monotonic time
+        start = time.monotonic_ns()
+        pipe.send(("start", (time.time_ns(), start)))
+
+        chunk = []
+        for sample in samples:
+            if isinstance(sample, float):
+                yield sample
+                continue
+
+            chunk.append(sample)
+
+            if len(chunk) >= chunk_size:
+                self._send_chunk(pipe, chunk)
+                chunk = []
+
+        if chunk:
+            self._send_chunk(pipe, chunk)
+
+        pipe.send(("end", self._window_summary(start, time.monotonic_ns())))
+
+    def _record_overrun(self, timestamp: int | None = None) -> None:
+        # Called by captures when the sensor reports lost samples
+        if timestamp is None:
+            timestamp = time.monotonic_ns()
+
+        self._overruns.append(timestamp)
+
+    def _window_summary(self, start: int, stop: int) -> dict[str, Any]:
+        # What the subprocess knows about a window and the parent does not
+        overruns = sum(1 for timestamp in self._overruns if start <= timestamp <= stop)
+
+        return {"overruns": overruns}
+
+    def _send_chunk(self, pipe: Connection, chunk: list[tuple[int, Any]]) -> None:
+        timestamps = np.array([timestamp for timestamp, _ in chunk], dtype=np.int64)
+        values = np.array([values for _, values in chunk], dtype=self.RECORD_DTYPE[1])
+
+        if self._ring is None:
+            pipe.send(("chunk", timestamps, values))
+        else:
+            start, stop = self._ring.write(self._to_records(timestamps, values))
+            pipe.send(("chunk", start, stop))
+
+    def _send_records(self, pipe: Connection, records: np.ndarray) -> None:
+        # Same as _send_chunk, for samples that already are RECORD_DTYPE records
+        if self._ring is None:
+            capture = self._records_to_capture(records, None)
+            pipe.send(("chunk", capture.timestamps, capture.values))
+        else:
+            start, stop = self._ring.write(records)
+            pipe.send(("chunk", start, stop))
+
+    def _to_records(self, timestamps: np.ndarray, values: np.ndarray) -> np.ndarray:
+        records = np.empty(len(timestamps), dtype=self.RECORD_DTYPE)
+        records["time"] = timestamps
+
+        values = values.reshape(len(timestamps), -1)
+        for i, field in enumerate(self.RECORD_DTYPE.names[1:]):
+            records[field] = values[:, i]
+
+        return records
+
+    def _handle_message(self, pipe: Connection, message: tuple) -> None:
+        # if pipe says "read", send out the data into the pipe
+        if message[0] == "read":
+            pipe.send(self._sensor.read())
+        elif message[0] == "stream for":
+            self._task = self._stream_task(pipe, self._capture(message[1]), message[2])
+        elif message[0] == "bus stats":
+            pipe.send(self._sensor.bus_stats(message[1]))
+
+    def _service(self, ready: bool = False) -> float | None:
+        # Runs the task (also when the data-ready line fired) and the
+        # background task if they are due, until they have to wait again.
+        # Returns the earliest monotonic time one of them wants to run again
+        # at (None if there is nothing to run).
+        now = time.monotonic()
+
+        if self._task is not None and (ready or self._task_due <= now):
+            try:
+                self._task_due = next(self._task)
+            except StopIteration:
+                # start the task requested while this one ran, if any
+                self._task = None
+                if self._queued_tasks:
+                    self._task = self._queued_tasks.popleft()
+                self._task_due = now
+
+        if self._background is not None and self._background_due <= now:
+            try:
+                self._background_due = next(self._background)
+            except StopIteration:
+                self._background = None
+
+        deadlines = []
+        if self._task is not None:
+            deadlines.append(self._task_due)
+        if self._background is not None:
+            deadlines.append(self._background_due)
+
+        return min(deadlines, default=None)
+
+    def _background_task(self) -> Iterator[float] | None:
+        # Generator yielding the monotonic times it next needs to run at
+        return None
+
     def _internal_loop(self, pipe: Connection) -> None:
+        # this is a loop that manages the running of the sensor.
+        BaseController._run([self])
+
+    def _start_internal(self) -> None:
+        # Initialize Sensor
+        self._sensor = self._initialize_sensor()
+
+        if self._bus_stats:
+            self._sensor.enable_bus_stats()
+
+        # Write any settings, config, etc
+        self._sensor.enable_register_cache()
+        with self._sensor.deferred_writes():
+            self._configure_sensor()
+
+        if self._ready_line is not None:
+            self._ready_line.start()
+
+        self._background = self._background_task()
+        self._ready = False
+
+        # tasks requested while another one was running, in order
+        self._queued_tasks = deque()
+
+    def _waitables(self) -> list[Any]:
+        # The data-ready line only matters while a task is capturing
+        if self._task is not None and self._ready_line is not None:
+            return [self._internal_pipe, self._ready_line]
+
+        return [self._internal_pipe]
+
+    def _wake(self, woken: list[Any]) -> bool:
+        # Handles what woke the loop up, False once the parent process is gone
+        self._ready = self._ready_line is not None and self._ready_line in woken
+
+        if self._internal_pipe not in woken:
+            return True
+
+        try:
+            message = self._internal_pipe.recv()
+        except EOFError:
+            return False
+
+        task = self._task
+        self._handle_message(self._internal_pipe, message)
+
+        if self._task is not task:
+            if task is None:
+                self._task_due = 0.0
+            else:
+                # tasks are run one at a time, in the order they were requested
+                self._queued_tasks.append(self._task)
+                self._task = task
+
+        return True
+
+    @staticmethod
+    def _run(controllers: list[BaseController]) -> None:
+        # Runs the subprocess side of controllers from one thread, sleeping
+        # until a pipe or data-ready line of one of them needs attention, or
+        # the earliest of their deadlines
+        for controller in controllers:
+            controller._start_internal()
+
+        controllers = list(controllers)
+        while controllers:
+            deadlines = []
+            waitables = []
+            for controller in controllers:
+                deadline = controller._service(controller._ready)
+                if deadline is not None:
+                    deadlines.append(deadline)
+
+                waitables.extend(controller._waitables())
+
+            timeout = None
+            if deadlines:
+                timeout = max(0.0, min(deadlines) - time.monotonic())
+
+            woken = wait(waitables, timeout)
+
+            controllers = [
+                controller for controller in controllers if controller._wake(woken)
+            ]
+
+    @abstractmethod
+    def _capture(self, seconds: float) -> Iterator[tuple[int, Any] | float]:
+        ...
+
+    @abstractmethod
+    def _initialize_sensor(self) -> Any:
+        ...
+
+    @abstractmethod
+    def _configure_sensor(self) -> None:
         ...
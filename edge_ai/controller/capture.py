@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import datetime
+from typing import Any, Iterable
+
+import numpy as np
+
+DEFAULT_TIMEFORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+
+class Capture:
+    """
+    Samples captured by a controller over one window (or one chunk of it).
+    timestamps are int64 CLOCK_MONOTONIC nanoseconds. anchor pairs a wall
+    clock reading with a monotonic one, both in ns, taken once at the start
+    of the window, so wall clock times and strings are only computed when
+    asked for, all at once.
+    metadata describes how the window was captured. Controllers fill it in
+    for read_for and read_around: the configured "datarate", the
+    "achieved_rate" (Hz), the number of sensor "overruns" (samples lost
+    because they were not read in time) and the largest gap between samples,
+    "max_gap" (seconds).
+    """
+
+    def __init__(
+        self,
+        timestamps: np.ndarray,
+        values: np.ndarray,
+        anchor: tuple[int, int],
+        metadata: dict[str, Any] | None = None,
+    ) -> None:
+        self.timestamps = timestamps
+        self.values = values
+        self.anchor = anchor
+        self.metadata = metadata if metadata is not None else {}
+
+    @staticmethod
+    def concatenate(captures: Iterable[Capture]) -> Capture:
+        captures = list(captures)
+        if not captures:
+            raise Exception("Cannot concatenate an empty list of captures")
+
+        return Capture(
+            np.concatenate([capture.timestamps for capture in captures]),
+            np.concatenate([capture.values for capture in captures]),
+            captures[0].anchor,
+            dict(captures[0].metadata),
+        )
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def copy(self) -> Capture:
+        return Capture(
+            self.timestamps.copy(),
+            self.values.copy(),
+            self.anchor,
+            dict(self.metadata),
+        )
+
+    def achieved_rate(self) -> float | None:
+        # Samples per second between the first and the last sample
+        if len(self) < 2 or self.timestamps[-1] == self.timestamps[0]:
+            return None
+
+        duration = int(self.timestamps[-1] - self.timestamps[0]) / 1e9
+
+        return (len(self) - 1) / duration
+
+    def max_gap(self) -> float | None:
+        # Largest time between consecutive samples, in seconds
+        if len(self) < 2:
+            return None
+
+        return float(np.diff(self.timestamps).max()) / 1e9
+
+    def wall_ns(self) -> np.ndarray:
+        # UTC epoch nanoseconds
+        wall, monotonic = self.anchor
+        return self.timestamps - monotonic + wall
+
+    def utc_offset_ns(self) -> int:
+        # Local time zone offset at the start of the window
+        wall, _ = self.anchor
+        offset = datetime.datetime.fromtimestamp(wall / 1e9).astimezone().utcoffset()
+
+        return int(offset.total_seconds() * 1e9)
+
+    def local_datetimes(self) -> np.ndarray:
+        # Naive local times as datetime64[us], like datetime.datetime.now()
+        return (
+            (self.wall_ns() + self.utc_offset_ns())
+            .astype("datetime64[ns]")
+            .astype("datetime64[us]")
+        )
+
+    def format(self, timeformat: str = DEFAULT_TIMEFORMAT) -> list[str]:
+        times = self.local_datetimes()
+
+        if timeformat == DEFAULT_TIMEFORMAT:
+            # ISO 8601 is the default format with a "T" instead of the space
+            return np.char.replace(
+                np.datetime_as_string(times, unit="us"), "T", " "
+            ).tolist()
+
+        return [f"{time:{timeformat}}" for time in times.tolist()]
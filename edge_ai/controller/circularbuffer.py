@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+from typing import Any
+
+import numpy as np
+
+
+class CircularBuffer:
+    """
+    The latest capacity records of a dtype whose first field is "time", in
+    time order, overwriting the oldest ones when full.
+    Unlike RingBuffer nothing is shared: it lives in the process that fills
+    it, and windows are copied out of it by time.
+    """
+
+    def __init__(self, dtype: Any, capacity: int) -> None:
+        self._records = np.zeros(capacity, dtype=dtype)
+        self._capacity = capacity
+
+        # total number of records ever appended
+        self._count = 0
+
+    def __len__(self) -> int:
+        return min(self._count, self._capacity)
+
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+    @property
+    def latest(self) -> int | None:
+        # Time of the newest record
+        if self._count == 0:
+            return None
+
+        return int(self._records["time"][(self._count - 1) % self._capacity])
+
+    def append(self, records: np.ndarray) -> None:
+        records = records[-self._capacity :]
+        count = len(records)
+
+        index = self._count % self._capacity
+        first = min(count, self._capacity - index)
+
+        self._records[index : index + first] = records[:first]
+        self._records[: count - first] = records[first:]
+
+        self._count += count
+
+    def between(self, start: int, stop: int) -> np.ndarray:
+        # Copy of the records with start <= time <= stop, in the order they
+        # were appended. A mask rather than a binary search, so records
+        # whose times went backwards are neither dropped nor duplicated.
+        index = self._count % self._capacity
+        if self._count <= self._capacity:
+            segments = [self._records[: self._count]]
+        else:
+            segments = [self._records[index:], self._records[:index]]
+
+        window = []
+        for segment in segments:
+            times = segment["time"]
+            window.append(segment[(times >= start) & (times <= stop)])
+
+        return np.concatenate(window)
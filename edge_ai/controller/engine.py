@@ -0,0 +1,45 @@
+from __future__ import annotations
+
+import multiprocessing as mp
+
+from .basecontroller import BaseController
+
+
+class AcquisitionEngine:
+    """
+    Runs several controllers in one subprocess instead of one each.
+    The subprocess services all of them from a single thread, so every
+    transaction on a bus is issued in turn (sensors on one I2C bus also
+    share its handle) and each controller is run as often as its own
+    tasks ask for, i.e. at its data rate. Controllers keep their API and
+    their own pipes, shared memory rings and data-ready lines, and are
+    started and stopped through the engine.
+    """
+
+    def __init__(self) -> None:
+        self._controllers = []
+        self._process = mp.Process(
+            target=BaseController._run, args=(self._controllers,), daemon=True
+        )
+
+    def add(self, controller: BaseController) -> None:
+        if self._process.is_alive():
+            raise Exception("Controllers must be added before starting")
+
+        controller._engine = self
+        controller._process = self._process
+
+        self._controllers.append(controller)
+
+    def start(self) -> None:
+        self._process.start()
+
+    def stop(self) -> None:
+        if not self._process.is_alive():
+            raise Exception("Attempted to stop engine before starting")
+
+        # close running process
+        self._process.kill()
+
+        for controller in self._controllers:
+            controller._release()
@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import time
+from multiprocessing import shared_memory
+from typing import Any
+
+import numpy as np
+
+
+class RingBuffer:
+    """
+    Fixed-width record ring buffer in shared memory.
+    One process appends records, another reads them back as NumPy views of
+    the shared block. Positions are absolute cursors (the total number of
+    records ever written), so they never wrap and can be passed around as
+    plain ints.
+    Only the low 32 bits of the cursors are shared, as 32-bit loads and
+    stores are atomic on the 32-bit ARM boards too, where 64-bit ones are
+    not. Each side keeps its own cursor in full and rebuilds the other one
+    from it, which holds as the two are never more than capacity apart.
+    """
+
+    # write cursor and read cursor, uint32 each, padded for the records
+    HEADER_SIZE = 16
+    CURSOR_MASK = 0xFFFFFFFF
+
+    def __init__(self, dtype: Any, capacity: int, name: str | None = None) -> None:
+        if capacity > self.CURSOR_MASK // 2:
+            raise Exception(f"Ring buffer capacity must be below {2**31} records")
+
+        self._dtype = np.dtype(dtype)
+        self._capacity = capacity
+
+        # full cursors as last written and released by this process
+        self._written = 0
+        self._released = 0
+
+        if name is None:
+            size = self.HEADER_SIZE + self._dtype.itemsize * capacity
+            self._shm = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self._shm = shared_memory.SharedMemory(name=name)
+
+        self._cursors = np.ndarray((2,), dtype=np.uint32, buffer=self._shm.buf)
+        self._records = np.ndarray(
+            (capacity,),
+            dtype=self._dtype,
+            buffer=self._shm.buf,
+            offset=self.HEADER_SIZE,
+        )
+
+        if name is None:
+            self._cursors[:] = 0
+
+    def __reduce__(self) -> tuple:
+        # Attach to the same block when sent to another process
+        return (RingBuffer, (self._dtype, self._capacity, self._shm.name))
+
+    @property
+    def dtype(self) -> np.dtype:
+        return self._dtype
+
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+    @property
+    def write_cursor(self) -> int:
+        # the writer is never behind what either side knows of
+        known = max(self._written, self._released)
+        return known + ((int(self._cursors[0]) - known) & self.CURSOR_MASK)
+
+    @property
+    def read_cursor(self) -> int:
+        # and the reader never ahead of it
+        known = max(self._written, self._released)
+        return known - ((known - int(self._cursors[1])) & self.CURSOR_MASK)
+
+    def write(self, records: np.ndarray) -> tuple[int, int]:
+        # Appends records, waiting for the reader to release space if needed.
+        # Returns the cursors of the written range.
+        count = len(records)
+        if count > self._capacity:
+            raise Exception(
+                f"Cannot write {count} records to a ring buffer of {self._capacity}"
+            )
+
+        start = self.write_cursor
+        while start + count - self.read_cursor > self._capacity:
+            time.sleep(0.0005)
+
+        index = start % self._capacity
+        first = min(count, self._capacity - index)
+
+        self._records[index : index + first] = records[:first]
+        self._records[: count - first] = records[first:]
+
+        self._written = start + count
+        self._cursors[0] = self._written & self.CURSOR_MASK
+
+        return start, start + count
+
+    def views(self, start: int, stop: int) -> list[np.ndarray]:
+        # Zero-copy views of the records in [start, stop), two of them if the
+        # range wraps around the end of the buffer
+        if stop - start > self._capacity:
+            raise Exception("Requested range has already been overwritten")
+
+        index = start % self._capacity
+        count = stop - start
+
+        if index + count <= self._capacity:
+            return [self._records[index : index + count]]
+
+        return [self._records[index:], self._records[: index + count - self._capacity]]
+
+    def read(self, start: int, stop: int) -> np.ndarray:
+        # View of [start, stop), only copied if the range wraps
+        views = self.views(start, stop)
+
+        if len(views) == 1:
+            return views[0]
+
+        return np.concatenate(views)
+
+    def release(self, cursor: int) -> None:
+        # Everything before cursor may be overwritten by the writer
+        self._released = cursor
+        self._cursors[1] = cursor & self.CURSOR_MASK
+
+    def close(self) -> None:
+        del self._cursors, self._records
+        self._shm.close()
+
+    def unlink(self) -> None:
+        self._shm.unlink()
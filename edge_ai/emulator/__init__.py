@@ -0,0 +1,3 @@
+from . import waveform
+from .ads1015 import ADS1015Emulator
+from .lis3dh import LIS3DHEmulator
@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+import time
+from typing import List
+
+from ..bus import SimulatedBus
+from ..sensor.adc import ADS1015
+from .waveform import Waveform, constant
+
+
+class ADS1015Emulator(SimulatedBus):
+    """
+    Register-level ADS1015 behind the BaseBus interface.
+    inputs maps AIN0..AIN3 to waveforms in volts (0 V if left out). The
+    multiplexer, full scale range and data rate are taken from the config
+    register. In single-shot mode, writing the OS bit starts a conversion
+    which completes 1/DR later, the OS bit reading 0 until then; in
+    continuous mode conversions complete every 1/DR from when the mode was
+    set. Each conversion holds the input at its midpoint, clipped to the
+    full scale range. clock_error makes the internal oscillator slower
+    (e.g. 0.1 for the 10% the datasheet allows).
+    The comparator and ALERT/RDY pin are not emulated.
+    """
+
+    # Differential (positive, negative) inputs for every MUX setting, -1 is GND
+    MUX_INPUTS = {
+        **{bits: channels for channels, bits in ADS1015.CH_COMP.items()},
+        **{bits: (channel, -1) for channel, bits in ADS1015.CH_SINGLE.items()},
+    }
+
+    def __init__(
+        self,
+        inputs: dict[int, Waveform] | None = None,
+        latency: float = 0.0,
+        clock_error: float = 0.0,
+    ) -> None:
+        super().__init__(
+            {
+                ADS1015.CONFIG_REGISTER: [0x05, 0x83],
+                ADS1015.LO_THRESH_REGISTER: [0x80, 0x00],
+                ADS1015.HI_THRESH_REGISTER: [0x7F, 0xFF],
+            },
+            register_width=2,
+            latency=latency,
+        )
+
+        inputs = inputs or {}
+        self._inputs = {
+            channel: inputs.get(channel, constant(0.0)) for channel in range(4)
+        }
+        self._clock_error = clock_error
+
+        self._conversion = [0x00, 0x00]
+
+        # monotonic ns the pending single-shot conversion completes at, and
+        # the continuous conversions started at
+        self._single_shot_end = None
+        self._continuous_start = None
+        self._continuous_done = 0
+
+    def _config(self) -> int:
+        high, low = self._registers[ADS1015.CONFIG_REGISTER]
+        return high << 8 | low
+
+    def conversion_period(self) -> float:
+        # Nanoseconds per conversion at the configured data rate
+        rates = {code: rate for rate, code in ADS1015.DATARATES.items()}
+        rate = rates.get(self._config() >> 5 & 0b111, 3300)
+
+        return 1e9 / rate * (1 + self._clock_error)
+
+    def _convert(self, timestamp: float) -> None:
+        # Samples the selected input at timestamp (monotonic ns)
+        config = self._config()
+        positive, negative = self.MUX_INPUTS[config >> 12 & 0b111]
+
+        seconds = timestamp / 1e9
+        volts = self._inputs[positive](seconds)
+        if negative >= 0:
+            volts -= self._inputs[negative](seconds)
+
+        ranges = {code: fsr for fsr, code in ADS1015.RANGES.items()}
+        full_range = ranges.get(config >> 9 & 0b111, 0.256)
+
+        counts = max(-2048, min(2047, round(volts / full_range * 2048)))
+        word = (counts << 4) & 0xFFFF
+        self._conversion = [word >> 8, word & 0xFF]
+
+    def _update(self) -> None:
+        # Completes the conversions due by now
+        now = time.monotonic_ns()
+        period = self.conversion_period()
+
+        if self._single_shot_end is not None and now >= self._single_shot_end:
+            self._convert(self._single_shot_end - period / 2)
+            self._single_shot_end = None
+
+        if self._continuous_start is not None:
+            done = int((now - self._continuous_start) // period)
+            if done > self._continuous_done:
+                self._convert(self._continuous_start + (done - 0.5) * period)
+                self._continuous_done = done
+
+    def _read_register_list(self, register: int, length: int) -> List[int]:
+        self._transaction()
+        self._update()
+
+        if register == ADS1015.CONVERSION_REGISTER:
+            return self._conversion[:length]
+        elif register == ADS1015.CONFIG_REGISTER:
+            high, low = self._registers[register]
+
+            # OS: 1 while no conversion is in progress
+            if self._single_shot_end is None and self._continuous_start is None:
+                high |= 0x80
+
+            return [high, low][:length]
+
+        return self._registers.get(register, [0, 0])[:length]
+
+    def _write_register_list(self, register: int, value: List[int]) -> None:
+        self._transaction()
+        self._update()
+
+        if register == ADS1015.CONVERSION_REGISTER:
+            return
+
+        if register != ADS1015.CONFIG_REGISTER:
+            self._registers[register] = list(value)
+            return
+
+        previous = self._config()
+        high, low = value
+        self._registers[register] = [high & 0x7F, low]
+
+        # MUX and DR bits
+        changed = (previous ^ self._config()) & 0x70E0
+
+        now = time.monotonic_ns()
+        if not high & 0x01:
+            # continuous mode, restarted when the input or rate changes
+            if self._continuous_start is None or changed:
+                self._continuous_start = now
+                self._continuous_done = 0
+        else:
+            self._continuous_start = None
+
+            if high & 0x80 and self._single_shot_end is None:
+                self._single_shot_end = now + self.conversion_period()
@@ -0,0 +1,240 @@
+from __future__ import annotations
+
+import time
+from collections import deque
+from typing import Callable, List
+
+from ..bus import SimulatedBus
+from ..sensor.accel import LIS3DH
+from .waveform import axes, constant
+
+WHO_AM_I = 0x0F
+
+READ_ONLY = {
+    WHO_AM_I,
+    LIS3DH.STATUS_REGISTER,
+    LIS3DH.FIFO_SRC_REGISTER,
+    *range(LIS3DH.OUT_X_L, LIS3DH.OUT_Z_H + 1),
+}
+
+
+class LIS3DHEmulator(SimulatedBus):
+    """
+    Register-level LIS3DH behind the BaseBus interface.
+    Samples are taken from source, a function of the monotonic time in
+    seconds returning (x, y, z) in g, at the output data rate set in
+    CTRL_REG1 and encoded with the resolution and full scale set in
+    CTRL_REG1/CTRL_REG4. Time only moves on when the bus is accessed, at
+    which point all samples due since the last access are produced.
+    STATUS_REG reports new data (ZYXDA) and overruns (ZYXOR) and is cleared
+    by reading OUT_Z_H. With FIFO_EN set and a FIFO mode other than bypass,
+    samples queue up in a 32-sample FIFO (FIFO_SRC_REG), each read of
+    OUT_X_L pops the oldest one, and auto-incremented reads roll over from
+    OUT_Z_H back to OUT_X_L. Multi-byte transfers only advance the address
+    with AUTO_INCREMENT set, like the device on I2C. clock_error makes the
+    internal oscillator slower, or faster if negative (e.g. -0.1 for an
+    ODR 10% above nominal).
+    """
+
+    FIFO_SIZE = LIS3DH.FIFO_SIZE
+
+    # CTRL_REG1 ODR bits -> Hz, 8 and 9 depend on the low power bit
+    DATARATES = {1: 1, 2: 10, 3: 25, 4: 50, 5: 100, 6: 200, 7: 400}
+    FULL_SCALES = {bits: g for g, bits in LIS3DH.MEASUREMENT_RANGES.items()}
+
+    def __init__(
+        self,
+        source: Callable[[float], tuple[float, float, float]] | None = None,
+        latency: float = 0.0,
+        clock_error: float = 0.0,
+    ) -> None:
+        super().__init__(
+            {WHO_AM_I: [0x33], LIS3DH.CTRL_REG0: [0x10], LIS3DH.CTRL_REG1: [0x07]},
+            latency=latency,
+        )
+
+        # at rest, lying flat
+        self._source = source or axes(constant(0.0), constant(0.0), constant(1.0))
+        self._clock_error = clock_error
+
+        self._status = 0
+        self._output = [0] * 6
+        self._fifo = deque()
+        self._fifo_overrun = False
+
+        # ODR the samples are being produced at, and monotonic time (ns) the
+        # next one is due at
+        self._rate = 0
+        self._next_sample = 0.0
+
+    def datarate(self) -> int:
+        # Current output data rate in Hz, 0 when powered down
+        odr = self._register(LIS3DH.CTRL_REG1) >> 4
+        low_power = self._register(LIS3DH.CTRL_REG1) & 0b00001000  # LPen
+
+        if odr == 8:
+            return 1620 if low_power else 0
+        elif odr == 9:
+            return 5376 if low_power else 1344
+
+        return self.DATARATES.get(odr, 0)
+
+    def _register(self, address: int) -> int:
+        return self._registers.get(address, [0])[0]
+
+    def _bits(self) -> int:
+        if self._register(LIS3DH.CTRL_REG1) & 0b00001000:
+            return 8
+        elif self._register(LIS3DH.CTRL_REG4) & 0b00001000:  # HR
+            return 12
+
+        return 10
+
+    def _fifo_mode(self) -> int:
+        # 0 (bypass) while the FIFO is disabled
+        if not self._register(LIS3DH.CTRL_REG5) & 0b01000000:
+            return 0
+
+        return self._register(LIS3DH.FIFO_CTRL_REGISTER) >> 6
+
+    def _update(self) -> None:
+        # Produces the samples due since the last access
+        rate = self.datarate()
+        now = time.monotonic_ns()
+
+        if rate != self._rate:
+            self._rate = rate
+            self._next_sample = now + self._period() if rate else 0.0
+            return
+
+        if not rate or now < self._next_sample:
+            return
+
+        period = self._period()
+        due = int((now - self._next_sample) // period) + 1
+
+        # older samples would be overwritten before they could be read anyway
+        skipped = max(0, due - (self.FIFO_SIZE + 1))
+        if skipped:
+            self._overrun()
+
+        for i in range(skipped, due):
+            self._sample(self._next_sample + i * period)
+
+        self._next_sample += due * period
+
+    def _period(self) -> float:
+        # ns between samples at the current ODR
+        return 1e9 / self.datarate() * (1 + self._clock_error)
+
+    def _sample(self, timestamp: float) -> None:
+        self._output = self._encode(self._source(timestamp / 1e9))
+
+        if self._status & LIS3DH.STATUS_ZYXDA:
+            self._status |= 0b11110000  # ZYXOR, ZOR, YOR, XOR
+        self._status |= 0b00001111  # ZYXDA, ZDA, YDA, XDA
+
+        mode = self._fifo_mode()
+        if mode == 0:
+            return
+
+        if len(self._fifo) == self.FIFO_SIZE:
+            self._fifo_overrun = True
+            if mode == 0b01:
+                # FIFO mode stops collecting once full
+                return
+            self._fifo.popleft()
+
+        self._fifo.append(self._output)
+
+    def _overrun(self) -> None:
+        self._status |= 0b11110000
+        if self._fifo_mode() != 0:
+            self._fifo_overrun = True
+
+    def _encode(self, values: tuple[float, float, float]) -> List[int]:
+        # Left-justified little-endian two's complement, OUT_X_L..OUT_Z_H
+        bits = self._bits()
+        fs_bits = self._register(LIS3DH.CTRL_REG4) >> 4 & 0b11
+        full_scale = self.FULL_SCALES[fs_bits]
+        limit = 2 ** (bits - 1)
+
+        raw = []
+        for value in values:
+            counts = max(-limit, min(limit - 1, round(value / full_scale * limit)))
+            word = (counts << (16 - bits)) & 0xFFFF
+            raw += [word & 0xFF, word >> 8]
+
+        return raw
+
+    def _fifo_source(self) -> int:
+        count = len(self._fifo)
+        watermark = self._register(LIS3DH.FIFO_CTRL_REGISTER) & 0b00011111
+
+        value = count & 0b00011111
+        if count >= watermark and count:
+            value |= LIS3DH.FIFO_SRC_WTM
+        if self._fifo_overrun or count == self.FIFO_SIZE:
+            value |= LIS3DH.FIFO_SRC_OVRN
+        if not count:
+            value |= LIS3DH.FIFO_SRC_EMPTY
+
+        return value
+
+    def _read_byte(self, address: int) -> int:
+        if address == LIS3DH.STATUS_REGISTER:
+            return self._status
+        elif address == LIS3DH.FIFO_SRC_REGISTER:
+            return self._fifo_source()
+        elif LIS3DH.OUT_X_L <= address <= LIS3DH.OUT_Z_H:
+            if address == LIS3DH.OUT_X_L and self._fifo_mode() != 0 and self._fifo:
+                self._output = self._fifo.popleft()
+                self._fifo_overrun = False
+            elif address == LIS3DH.OUT_Z_H and self._fifo_mode() == 0:
+                self._status = 0
+
+            return self._output[address - LIS3DH.OUT_X_L]
+
+        return self._register(address)
+
+    def _next_address(self, address: int) -> int:
+        if address == LIS3DH.OUT_Z_H and self._fifo_mode() != 0:
+            return LIS3DH.OUT_X_L
+
+        return address + 1
+
+    def _read_register_list(self, register: int, length: int) -> List[int]:
+        self._transaction()
+        self._update()
+
+        increment = register & self.AUTO_INCREMENT
+        address = register & ~self.AUTO_INCREMENT
+
+        values = []
+        for _ in range(length):
+            values.append(self._read_byte(address))
+            if increment:
+                address = self._next_address(address)
+
+        return values
+
+    def _write_register_list(self, register: int, value: List[int]) -> None:
+        self._transaction()
+
+        # samples due so far were taken with the old settings
+        self._update()
+
+        increment = register & self.AUTO_INCREMENT
+        address = register & ~self.AUTO_INCREMENT
+
+        for byte in value:
+            if address not in READ_ONLY:
+                self._registers[address] = [byte]
+
+            if self._fifo_mode() == 0:
+                # bypass mode empties the FIFO
+                self._fifo.clear()
+                self._fifo_overrun = False
+
+            if increment:
+                address += 1
@@ -0,0 +1,38 @@
+from __future__ import annotations
+
+import math
+import random
+from typing import Callable
+
+# Waveforms are functions of the monotonic time in seconds, returning the
+# signal at that time: volts for ADC inputs, g for an accelerometer axis.
+Waveform = Callable[[float], float]
+
+
+def constant(value: float) -> Waveform:
+    return lambda t: value
+
+
+def sine(
+    amplitude: float, frequency: float, offset: float = 0.0, phase: float = 0.0
+) -> Waveform:
+    return lambda t: offset + amplitude * math.sin(2 * math.pi * frequency * t + phase)
+
+
+def square(low: float, high: float, period: float, duty: float = 0.5) -> Waveform:
+    # high for the first duty fraction of every period
+    return lambda t: high if t % period < duty * period else low
+
+
+def noisy(waveform: Waveform, sigma: float, seed: int | None = None) -> Waveform:
+    # Adds gaussian noise with standard deviation sigma
+    generator = random.Random(seed)
+
+    return lambda t: waveform(t) + generator.gauss(0.0, sigma)
+
+
+def axes(
+    x: Waveform, y: Waveform, z: Waveform
+) -> Callable[[float], tuple[float, float, float]]:
+    # Combines one waveform per axis into an accelerometer source
+    return lambda t: (x(t), y(t), z(t))
@@ -0,0 +1,3 @@
+from .baseline import BaseLine
+from .chardev import GPIOLine
+from .fake import FakeLine
@@ -0,0 +1,40 @@
+from __future__ import annotations
+
+import select
+from abc import ABC, abstractmethod
+
+
+class BaseLine(ABC):
+    """
+    Base class for input lines that report edges, such as a sensor's
+    data-ready pin.
+    Edge timestamps are CLOCK_MONOTONIC nanoseconds, comparable with
+    time.monotonic_ns(). Lines are waitable: fileno() becomes readable
+    while edges are pending.
+    """
+
+    @abstractmethod
+    def start(self) -> None:
+        ...
+
+    @abstractmethod
+    def stop(self) -> None:
+        ...
+
+    @abstractmethod
+    def fileno(self) -> int:
+        ...
+
+    @abstractmethod
+    def read_events(self) -> list[int]:
+        # Timestamps of all pending edges, oldest first, without blocking
+        ...
+
+    def wait(self, timeout: float | None = None) -> int | None:
+        # Timestamp of the latest edge, waiting up to timeout seconds for one
+        events = self.read_events()
+
+        if not events and select.select([self], [], [], timeout)[0]:
+            events = self.read_events()
+
+        return events[-1] if events else None
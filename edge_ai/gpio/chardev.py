@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import ctypes
+import fcntl
+import os
+import struct
+
+from .baseline import BaseLine
+
+
+class _EventRequest(ctypes.Structure):
+    # struct gpioevent_request from linux/gpio.h
+    _fields_ = [
+        ("lineoffset", ctypes.c_uint32),
+        ("handleflags", ctypes.c_uint32),
+        ("eventflags", ctypes.c_uint32),
+        ("consumer_label", ctypes.c_char * 32),
+        ("fd", ctypes.c_int),
+    ]
+
+
+class GPIOLine(BaseLine):
+    """
+    Edge events of one line of a Linux GPIO character device
+    (/dev/gpiochipN), using the v1 line event ABI.
+    The kernel timestamps edges in its interrupt handler (CLOCK_MONOTONIC
+    since Linux 5.7), so timestamps don't include any userspace latency.
+    """
+
+    # _IOWR(0xB4, 0x04, struct gpioevent_request)
+    GPIO_GET_LINEEVENT_IOCTL = 0xC030B404
+    GPIOHANDLE_REQUEST_INPUT = 1 << 0
+
+    EDGES = {"rising": 1 << 0, "falling": 1 << 1, "both": (1 << 0) | (1 << 1)}
+
+    # struct gpioevent_data: u64 timestamp, u32 id, padded to 16 bytes
+    EVENT = struct.Struct("=QI4x")
+
+    # The kernel queues up to 16 events per line
+    MAX_EVENTS = 16
+
+    def __init__(
+        self,
+        chip: str = "/dev/gpiochip0",
+        line: int = 0,
+        edge: str = "rising",
+        consumer: str = "edge_ai",
+    ) -> None:
+        if edge not in self.EDGES.keys():
+            raise Exception(f'Edge must be one of {", ".join(self.EDGES.keys())}')
+
+        self._chip = chip
+        self._line = line
+        self._edge = edge
+        self._consumer = consumer
+
+        self._fd = None
+
+    def start(self) -> None:
+        request = _EventRequest(
+            lineoffset=self._line,
+            handleflags=self.GPIOHANDLE_REQUEST_INPUT,
+            eventflags=self.EDGES[self._edge],
+            consumer_label=self._consumer.encode()[:31],
+        )
+
+        chip_fd = os.open(self._chip, os.O_RDONLY)
+        try:
+            fcntl.ioctl(chip_fd, self.GPIO_GET_LINEEVENT_IOCTL, request, True)
+        finally:
+            os.close(chip_fd)
+
+        self._fd = request.fd
+        os.set_blocking(self._fd, False)
+
+    def stop(self) -> None:
+        if self._fd is None:
+            raise Exception("Attempted to stop line before starting")
+
+        os.close(self._fd)
+        self._fd = None
+
+    def fileno(self) -> int:
+        return self._fd
+
+    def read_events(self) -> list[int]:
+        try:
+            data = os.read(self._fd, self.EVENT.size * self.MAX_EVENTS)
+        except BlockingIOError:
+            return []
+
+        return [timestamp for timestamp, _ in self.EVENT.iter_unpack(data)]
@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+import os
+import struct
+import threading
+import time
+
+from .baseline import BaseLine
+
+
+class FakeLine(BaseLine):
+    """
+    Software line for running without hardware.
+    Edges are produced by trigger(), which also works from another process
+    after a fork, or at a fixed rate by a background thread once started.
+    """
+
+    EVENT = struct.Struct("=q")
+
+    def __init__(self, rate: float | None = None) -> None:
+        self._rate = rate
+
+        self._read_fd, self._write_fd = os.pipe()
+        os.set_blocking(self._read_fd, False)
+
+        self._thread = None
+        self._running = False
+
+    def start(self) -> None:
+        if self._rate is None or self._running:
+            return
+
+        self._running = True
+        self._thread = threading.Thread(target=self._generate, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._running = False
+
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def trigger(self, timestamp: int | None = None) -> None:
+        if timestamp is None:
+            timestamp = time.monotonic_ns()
+
+        os.write(self._write_fd, self.EVENT.pack(timestamp))
+
+    def fileno(self) -> int:
+        return self._read_fd
+
+    def read_events(self) -> list[int]:
+        try:
+            data = os.read(self._read_fd, self.EVENT.size * 1024)
+        except BlockingIOError:
+            return []
+
+        return [timestamp for (timestamp,) in self.EVENT.iter_unpack(data)]
+
+    def _generate(self) -> None:
+        period = 1 / self._rate
+        next_edge = time.monotonic() + period
+
+        while self._running:
+            delay = next_edge - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+            self.trigger()
+            next_edge += period
@@ -0,0 +1,2 @@
+from .pipeline import Pipeline
+from .stage import STOP, Source, Stage
@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+from typing import Any
+
+from .stage import Stage
+
+
+class Pipeline:
+    """
+    Stages connected by bounded queues, each running on its own thread, so
+    every stage works on its own item at the same time (e.g. the next
+    capture runs while the previous one is still being written).
+    The first stage is usually a Source.
+    """
+
+    def __init__(self, stages: list[Stage]) -> None:
+        self._stages = stages
+
+        for stage, next_stage in zip(stages, stages[1:]):
+            stage.output = next_stage.input
+
+    def start(self) -> None:
+        for stage in self._stages:
+            stage.start()
+
+    def join(self, timeout: float | None = None) -> None:
+        # Returns once STOP has gone through every stage
+        for stage in self._stages:
+            stage.join(timeout)
+
+    @property
+    def error(self) -> Exception | None:
+        # Exception that ended the pipeline early, if any
+        for stage in self._stages:
+            if stage.error is not None:
+                return stage.error
+
+        return None
+
+    def timings(self) -> dict[str, dict[str, Any]]:
+        return {stage.name: stage.timings() for stage in self._stages}
+
+    def format_timings(self) -> str:
+        timings = []
+        for stage in self._stages:
+            if stage.last is None:
+                timings.append(f"{stage.name} -")
+            else:
+                timings.append(
+                    f"{stage.name} {stage.last:.3f} s "
+                    f"(mean {stage.busy / stage.items:.3f} s, {stage.queue_depth} queued)"
+                )
+
+        return ", ".join(timings)
@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import logging
+import queue
+import threading
+import time
+from typing import Any, Callable
+
+# Returned by a source to end the pipeline, passed down through every stage
+STOP = object()
+
+
+class Stage:
+    """
+    One step of a Pipeline, running work(item) on its own thread.
+    Items are taken from a bounded input queue and results are put on the
+    next stage's queue, blocking while it is full, so a slow stage holds
+    back the ones before it instead of piling up work. None results are not
+    passed on. An exception is logged and drops that item only.
+    Time spent in work() is recorded for every item.
+    """
+
+    def __init__(self, name: str, work: Callable[[Any], Any], maxsize: int = 4) -> None:
+        self.name = name
+        self._work = work
+
+        self.input = queue.Queue(maxsize)
+        self.output = None
+
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+
+        # exception that ended the stage, if any
+        self.error = None
+
+        self.items = 0
+        self.busy = 0.0
+        self.last = None
+        self.max = 0.0
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def join(self, timeout: float | None = None) -> None:
+        self._thread.join(timeout)
+
+    @property
+    def queue_depth(self) -> int:
+        return self.input.qsize()
+
+    def timings(self) -> dict[str, Any]:
+        return {
+            "items": self.items,
+            "last": self.last,
+            "mean": self.busy / self.items if self.items else None,
+            "max": self.max,
+            "queued": self.queue_depth,
+        }
+
+    def _next_item(self) -> Any:
+        return self.input.get()
+
+    def _failed(self, error: Exception) -> Any:
+        # What to pass on instead of the item work() raised on
+        return None
+
+    def _run(self) -> None:
+        while True:
+            item = self._next_item()
+
+            if item is not STOP:
+                start = time.perf_counter()
+                try:
+                    item = self._work(item)
+                except Exception as e:
+                    logging.exception(e)
+                    item = self._failed(e)
+                finally:
+                    self.last = time.perf_counter() - start
+                    self.busy += self.last
+                    self.max = max(self.max, self.last)
+                    self.items += 1
+
+                logging.info(
+                    f"{self.name} stage took {self.last:.3f} s "
+                    f"({self.queue_depth} queued)"
+                )
+
+            if item is not None and self.output is not None:
+                self.output.put(item)
+
+            if item is STOP:
+                return
+
+
+class Source(Stage):
+    """
+    First step of a Pipeline: calls work() over and over, passing on what
+    it returns, until it returns STOP. An exception also ends the pipeline,
+    as calling work() again would most likely raise again (e.g. on a
+    controller whose subprocess died), and is kept in error.
+    """
+
+    def __init__(self, name: str, work: Callable[[], Any]) -> None:
+        super().__init__(name, lambda _: work(), maxsize=1)
+
+    def _next_item(self) -> Any:
+        return None
+
+    def _failed(self, error: Exception) -> Any:
+        self.error = error
+        return STOP
@@ -1,2 +1,14 @@
-from . import accel, adc
+import importlib
+
 from .basesensor import BaseSensor
+
+# Subpackages are imported on first access, so importing the package (or
+# one driver) does not load every driver
+_SUBMODULES = ("accel", "adc", "codec")
+
+
+def __getattr__(name: str):
+    if name in _SUBMODULES:
+        return importlib.import_module(f".{name}", __name__)
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
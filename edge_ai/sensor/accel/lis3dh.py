@@ -1,9 +1,12 @@
 from __future__ import annotations
 
-from typing import Type
+from typing import Sequence, Type
+
+import numpy as np
 
 from ...bus import I2C, SPI, BaseBus
 from ..basesensor import BaseSensor
+from ..codec import RawFrames, decode_lis3dh
 
 
 class LIS3DH(BaseSensor):
@@ -23,6 +26,8 @@ class LIS3DH(BaseSensor):
     MEASUREMENT_RANGES = {2: 0b00, 4: 0b01, 8: 0b10, 16: 0b11}
     SELFTEST_MODES = ["off", "low", "high"]
     RESOLUTIONS = {"low": 8, "normal": 10, "high": 12}
+    FIFO_MODES = {"bypass": 0b00, "fifo": 0b01, "stream": 0b10, "stream_to_fifo": 0b11}
+    FIFO_SIZE = 32
 
     # Register addresses
     # Config Registers
@@ -37,6 +42,10 @@ class LIS3DH(BaseSensor):
     REFERENCE_REGISTER = 0x26
     STATUS_REGISTER = 0x27
 
+    # Status register bits
+    STATUS_ZYXDA = 0b00001000  # new X, Y and Z data available
+    STATUS_ZYXOR = 0b10000000  # X, Y and Z data overrun
+
     # Output Registers
     OUT_X_L = 0x28
     OUT_X_H = 0x29
@@ -45,6 +54,27 @@ class LIS3DH(BaseSensor):
     OUT_Z_L = 0x2C
     OUT_Z_H = 0x2D
 
+    # FIFO Registers
+    FIFO_CTRL_REGISTER = 0x2E
+    FIFO_SRC_REGISTER = 0x2F
+
+    # FIFO source register bits
+    FIFO_SRC_WTM = 0b10000000  # watermark level reached
+    FIFO_SRC_OVRN = 0b01000000  # FIFO full, oldest sample overwritten
+    FIFO_SRC_EMPTY = 0b00100000
+    FIFO_SRC_FSS = 0b00011111  # number of unread samples
+
+    # FIFO_CTRL_REG is left out: enable_fifo relies on writing it twice
+    CACHEABLE_REGISTERS = [
+        CTRL_REG0,
+        CTRL_REG1,
+        CTRL_REG2,
+        CTRL_REG3,
+        CTRL_REG4,
+        CTRL_REG5,
+        CTRL_REG6,
+    ]
+
     def __init__(self, bus: Type[BaseBus]) -> None:
         super().__init__(bus)
 
@@ -54,6 +84,10 @@ class LIS3DH(BaseSensor):
         self._datarate = 5376
         self._selftest = "off"
         self._highpass = False
+        self._fifo_mode = "bypass"
+
+        # frames read with ZYXOR set, i.e. with samples overwritten unread
+        self._overruns = 0
 
         # TODO: setters should update these
 
@@ -80,6 +114,8 @@ class LIS3DH(BaseSensor):
 
         self._bus.write_register(self.CTRL_REG4, cfg)
 
+        self._measurement_range = measurement_range
+
     def set_datarate(self, datarate: int) -> None:
         if datarate not in self.DATARATES.keys():
             valid_rates = [str(rate) for rate in self.DATARATES.keys()]
@@ -93,6 +129,7 @@ class LIS3DH(BaseSensor):
 
         cfg = self._bus.read_register(self.CTRL_REG1)
 
+        cfg &= 0b00001111
         cfg |= self.DATARATES[datarate] << 4
 
         self._bus.write_register(self.CTRL_REG1, cfg)
@@ -171,39 +208,145 @@ class LIS3DH(BaseSensor):
 
         self._bus.write_register(self.CTRL_REG1, cfg)
 
+    def set_interrupt1(
+        self, data_ready: bool = False, fifo_watermark: bool = False
+    ) -> None:
+        # Routes the data-ready and/or FIFO watermark signals to the INT1 pin
+        cfg = self._bus.read_register(self.CTRL_REG3)
+
+        cfg &= 0b11101011
+        if data_ready:
+            cfg |= 0b00010000  # I1_ZYXDA
+        if fifo_watermark:
+            cfg |= 0b00000100  # I1_WTM
+
+        self._bus.write_register(self.CTRL_REG3, cfg)
+
+    def enable_fifo(self, mode: str = "stream", watermark: int = 16) -> None:
+        if mode not in self.FIFO_MODES.keys():
+            raise Exception(
+                f'FIFO mode must be one of {", ".join(self.FIFO_MODES.keys())}'
+            )
+
+        if not 0 <= watermark < self.FIFO_SIZE:
+            raise Exception(
+                f"FIFO watermark must be between 0 and {self.FIFO_SIZE - 1}"
+            )
+
+        # Passing through bypass mode empties the FIFO
+        self._bus.write_register(self.FIFO_CTRL_REGISTER, 0)
+
+        cfg = self._bus.read_register(self.CTRL_REG5)
+        cfg |= 0b01000000  # set FIFO_EN bit on register 24 to on
+        self._bus.write_register(self.CTRL_REG5, cfg)
+
+        self._bus.write_register(
+            self.FIFO_CTRL_REGISTER, self.FIFO_MODES[mode] << 6 | watermark
+        )
+
+        self._fifo_mode = mode
+
+    def disable_fifo(self) -> None:
+        self._bus.write_register(self.FIFO_CTRL_REGISTER, 0)
+
+        cfg = self._bus.read_register(self.CTRL_REG5)
+        cfg &= 0b10111111  # set FIFO_EN bit on register 24 to off
+        self._bus.write_register(self.CTRL_REG5, cfg)
+
+        self._fifo_mode = "bypass"
+
+    def read_fifo(self) -> tuple[np.ndarray, bool]:
+        # Drains every unread sample as an (n, 3) array, oldest first, along
+        # with whether the FIFO overran (and lost samples) since the last drain
+        status = self._bus.read_register(self.FIFO_SRC_REGISTER)
+
+        overrun = bool(status & self.FIFO_SRC_OVRN)
+        if status & self.FIFO_SRC_EMPTY:
+            count = 0
+        elif overrun:
+            count = self.FIFO_SIZE
+        else:
+            count = status & self.FIFO_SRC_FSS
+
+        # With the FIFO enabled, auto-increment rolls back from OUT_Z_H to
+        # OUT_X_L, so consecutive samples come out of one burst
+        per_transfer = self._bus.MAX_READ_LENGTH // 6
+
+        frames = bytearray()
+        while count > 0:
+            length = min(count, per_transfer)
+            frames += self._bus.read_register_bytes(
+                self.OUT_X_L | self._bus.AUTO_INCREMENT, 6 * length
+            )
+
+            count -= length
+
+        return self.decode_frames(frames), overrun
+
+    def decode_frames(
+        self, frames: RawFrames, frame_size: int = 6, offset: int = 0
+    ) -> np.ndarray:
+        # Batch conversion of raw OUT_X_L..OUT_Z_H frames to g, see decode_lis3dh
+        return decode_lis3dh(
+            frames,
+            self.RESOLUTIONS[self._resolution],
+            self._measurement_range,
+            frame_size,
+            offset,
+        )
+
     def read(self) -> list[float]:
         raw_values = self._read_sensors()
         return [self._raw_sensor_value_to_gravity(value) for value in raw_values]
 
+    def read_new_data(self) -> list[float] | None:
+        # Single transaction alternative to new_data_available() + read()
+        status, *raw_values = self._read_frame()
+
+        if not status & self.STATUS_ZYXDA:
+            return None
+
+        return [self._raw_sensor_value_to_gravity(value) for value in raw_values]
+
     def new_data_available(self) -> bool:
         status = self._bus.read_register(self.STATUS_REGISTER)
         status = (status >> 3) & 1
         return bool(status)
 
-    def _read_sensors(self) -> tuple[int, int, int]:
-        x = self._bus.read_register(self.OUT_X_H)
-        y = self._bus.read_register(self.OUT_Y_H)
-        z = self._bus.read_register(self.OUT_Z_H)
+    @property
+    def overruns(self) -> int:
+        return self._overruns
 
-        if self._resolution != "low":
-            xl = self._bus.read_register(self.OUT_X_L)
-            yl = self._bus.read_register(self.OUT_Y_L)
-            zl = self._bus.read_register(self.OUT_Z_L)
+    def _read_frame(self) -> tuple[int, int, int, int]:
+        # STATUS_REG is directly followed by OUT_X_L..OUT_Z_H, so a single
+        # auto-incremented burst returns the status byte and all three axes
+        frame = self._bus.read_register_bytes(
+            self.STATUS_REGISTER | self._bus.AUTO_INCREMENT, 7
+        )
 
-            # Determine the number of "empty bits" on the right
-            bitshift = 16 - self.RESOLUTIONS[self._resolution]
+        if frame[0] & self.STATUS_ZYXOR:
+            self._overruns += 1
 
-            x = (x << 8 | xl) >> bitshift
-            y = (y << 8 | yl) >> bitshift
-            z = (z << 8 | zl) >> bitshift
+        return (frame[0], *self._combine_axes(frame, 1))
+
+    def _combine_axes(self, frame: Sequence[int], offset: int) -> tuple[int, int, int]:
+        # Output is left-justified, determine the number of "empty bits" on the right
+        bitshift = 16 - self.RESOLUTIONS[self._resolution]
+
+        x = (frame[offset + 1] << 8 | frame[offset]) >> bitshift
+        y = (frame[offset + 3] << 8 | frame[offset + 2]) >> bitshift
+        z = (frame[offset + 5] << 8 | frame[offset + 4]) >> bitshift
 
         return (x, y, z)
 
+    def _read_sensors(self) -> tuple[int, int, int]:
+        return self._read_frame()[1:]
+
     def _raw_sensor_value_to_gravity(self, value: int) -> float:
         bits = self.RESOLUTIONS[self._resolution]
 
         max_val = 2**bits
-        if value > max_val / 2.0:
+        if value >= max_val / 2.0:
             value -= max_val
 
         return float(value) / ((max_val / 2) / self._measurement_range)
@@ -1 +1 @@
-from .ads1015 import ADS1015
+from .ads1015 import ADS1015, ADS1015Config
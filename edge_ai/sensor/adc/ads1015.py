@@ -1,9 +1,128 @@
 from __future__ import annotations
 
-from typing import Type
+import time
+from contextlib import contextmanager
+from typing import Any, Iterable, Iterator, Type
+
+import numpy as np
 
 from ...bus import I2C, BaseBus
 from ..basesensor import BaseSensor
+from ..codec import RawFrames, decode_ads1015
+
+
+class ADS1015Config:
+    """
+    Settings held by the ADS1015 config register. to_word() packs them into
+    the 16-bit register value (without the OS bit), from_word() unpacks one.
+    mux is a single-ended channel, or a (positive, negative) channel pair for
+    differential readings. comp_queue is the number of conversions past a
+    threshold before ALERT/RDY asserts (1, 2 or 4), 0 disables the comparator.
+    Defaults are the power-on values.
+    """
+
+    QUEUE_LENGTHS = {1: 0b00, 2: 0b01, 4: 0b10, 0: 0b11}
+
+    def __init__(
+        self,
+        mux: int | tuple[int, int] = (0, 1),
+        full_range: float = 2.048,
+        continuous: bool = False,
+        data_rate: int = 1600,
+        comp_window: bool = False,
+        comp_polarity: int = 0,
+        comp_latch: bool = False,
+        comp_queue: int = 0,
+    ) -> None:
+        self.mux = tuple(mux) if isinstance(mux, (tuple, list)) else mux
+        self.full_range = full_range
+        self.continuous = continuous
+        self.data_rate = data_rate
+        self.comp_window = comp_window
+        self.comp_polarity = comp_polarity
+        self.comp_latch = comp_latch
+        self.comp_queue = comp_queue
+
+        self.validate()
+
+    def validate(self) -> None:
+        if isinstance(self.mux, tuple):
+            if self.mux not in ADS1015.CH_COMP:
+                raise Exception(
+                    f"Differential channels must be one of: {', '.join(str(pair) for pair in ADS1015.CH_COMP)}"
+                )
+        elif self.mux not in ADS1015.CH_SINGLE:
+            raise Exception(
+                f"Channel must be one of: {', '.join(str(ch) for ch in ADS1015.CH_SINGLE)}"
+            )
+
+        if self.full_range not in ADS1015.RANGES:
+            raise Exception(
+                f"Full scale range must be one of: {', '.join(str(fsr) for fsr in ADS1015.RANGES)}V"
+            )
+
+        if self.data_rate not in ADS1015.DATARATES:
+            raise Exception(
+                f"Data Rate must be one of: {', '.join(str(dr) for dr in ADS1015.DATARATES)}SPS"
+            )
+
+        if self.comp_polarity not in (ADS1015.COMP_POL_LOW, ADS1015.COMP_POL_HIGH):
+            raise Exception("Comparator polarity must be 0 (active low) or 1")
+
+        if self.comp_queue not in self.QUEUE_LENGTHS:
+            raise Exception("Comparator queue length must be one of: 0, 1, 2, 4")
+
+    def replace(self, **changes: Any) -> ADS1015Config:
+        # Copy with some settings changed
+        return ADS1015Config(**{**vars(self), **changes})
+
+    def to_word(self) -> int:
+        if isinstance(self.mux, tuple):
+            mux = ADS1015.CH_COMP[self.mux]
+        else:
+            mux = ADS1015.CH_SINGLE[self.mux]
+
+        mode = ADS1015.MODE_CONTINUOUS if self.continuous else ADS1015.MODE_SINGLE
+
+        return (
+            mux << 12
+            | ADS1015.RANGES[self.full_range] << 9
+            | mode << 8
+            | ADS1015.DATARATES[self.data_rate] << 5
+            | int(self.comp_window) << 4
+            | self.comp_polarity << 3
+            | int(self.comp_latch) << 2
+            | self.QUEUE_LENGTHS[self.comp_queue]
+        )
+
+    @staticmethod
+    def from_word(word: int) -> ADS1015Config:
+        def lookup(table: dict, bits: int) -> Any:
+            return next(key for key, value in table.items() if value == bits)
+
+        mux_bits = word >> 12 & 0b111
+        if mux_bits & 0b100:
+            mux = lookup(ADS1015.CH_SINGLE, mux_bits)
+        else:
+            mux = lookup(ADS1015.CH_COMP, mux_bits)
+
+        return ADS1015Config(
+            mux=mux,
+            full_range=lookup(ADS1015.RANGES, min(word >> 9 & 0b111, 0b101)),
+            continuous=not word >> 8 & 1,
+            data_rate=lookup(ADS1015.DATARATES, min(word >> 5 & 0b111, 0b110)),
+            comp_window=bool(word >> 4 & 1),
+            comp_polarity=word >> 3 & 1,
+            comp_latch=bool(word >> 2 & 1),
+            comp_queue=lookup(ADS1015Config.QUEUE_LENGTHS, word & 0b11),
+        )
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, ADS1015Config) and vars(self) == vars(other)
+
+    def __repr__(self) -> str:
+        settings = ", ".join(f"{key}={value!r}" for key, value in vars(self).items())
+        return f"ADS1015Config({settings})"
 
 
 class ADS1015(BaseSensor):
@@ -14,6 +133,8 @@ class ADS1015(BaseSensor):
 
     CONFIG_REGISTER_DEFAULT = [0x85, 0x83]
 
+    CACHEABLE_REGISTERS = [CONFIG_REGISTER, LO_THRESH_REGISTER, HI_THRESH_REGISTER]
+
     # Multiplexer (channel comparator values)
     # bits [14:12] on config register
     CH_COMP = {(0, 1): 0b000, (0, 3): 0b001, (1, 3): 0b010, (2, 3): 0b011}  # default
@@ -70,187 +191,236 @@ class ADS1015(BaseSensor):
     ASSERT_AFTER_4 = 0b10
     QUEUE_OFF = 0b11  # default
 
+    # The internal oscillator makes the actual data rate up to 10% slower than
+    # configured, and a single-shot conversion wakes the ADC up first (25us)
+    DATARATE_TOLERANCE = 0.1
+    WAKEUP_TIME = 25e-6
+
     def __init__(self, bus: Type[BaseBus]) -> None:
         super().__init__(bus)
 
-        # set up the bus
-        # self._adc = Adafruit_ADS1x15.ADS1015(address = self._address,
-        #                                      busnum = self._busnum)
-        # defaults
-        self._adc_gain = 1
-        self._read_diff = (0, 1)
-        self._read_single = None
-        self._full_range = 2.048
-        self._continuous_mode = True
-        self._datarate = 1600
-        self._traditional_comp = True
-        self._comp_polarity = 0
-        self._latching_comp = False
-        self._comp_queue = 0
-
-        # TODO: setters should update these
+        # Settings of the config register, written as a whole by configure()
+        self._config = ADS1015Config()
+
+        # last written config word (without OS) and threshold register values,
+        # None until written, as the device may have been set up before
+        self._config_word = None
+        self._thresholds = {
+            self.LO_THRESH_REGISTER: None,
+            self.HI_THRESH_REGISTER: None,
+        }
 
     @staticmethod
     def I2C(address: int = 0x48, busnum: int = 1) -> ADS1015:
         bus = I2C(address, busnum)
 
         adc = ADS1015(bus)
+        adc.enable_register_cache()
 
         # defaults
-        adc.start_adc()
-        adc.set_continuous(adc._continuous_mode)
-        adc.set_data_range(adc._full_range)
-        adc.set_data_rate(adc._datarate)
+        adc.configure(ADS1015Config(continuous=True), start=True)
 
-        # return ADS1015(bus)
         return adc
 
-    def set_differential_mode(self, channel1: int = 0, channel2: int = 1) -> None:
-        # TODO: checks
-        cfg = self._bus.read_register_list(self.CONFIG_REGISTER, 2)
+    @property
+    def config(self) -> ADS1015Config:
+        return self._config
 
-        cfg[0] &= 10001111
-        cfg[0] |= self.CH_COMP[(channel1, channel2)] << 4
+    def configure(self, config: ADS1015Config, start: bool = False) -> None:
+        # Writes the whole config register in one transaction, skipped if the
+        # device already has this config. start sets the OS bit, which starts
+        # a conversion in single-shot mode (continuous mode runs regardless).
+        message = self._config_message(config, start)
 
-        self._bus.write_register_list(self.CONFIG_REGISTER, cfg)
+        if message is not None:
+            self._bus.write_register_list(*message[1:])
 
-    def set_single_channel(self, channel: int = 0) -> None:
-        # TODO: checks
-        cfg = self._bus.read_register_list(self.CONFIG_REGISTER, 2)
+    def _config_message(
+        self, config: ADS1015Config, start: bool = False
+    ) -> tuple[str, int, list[int]] | None:
+        # Bus message writing config, see configure, None if it can be skipped
+        word = config.to_word()
+        self._config = config
 
-        cfg[0] &= 10001111  # TODO: change these to xor
-        cfg[0] |= self.CH_SINGLE[channel] << 4
+        if word == self._config_word and not (start and not config.continuous):
+            return None
 
-        # TODO: update internal variable _read_single
+        if start:
+            word |= 1 << 15
 
-        self._bus.write_register_list(self.CONFIG_REGISTER, cfg)
+        self._config_word = word & 0x7FFF
 
-    def set_data_range(self, full_scale_range: float = 2.048) -> None:
-        # TODO: checks
-        cfg = self._bus.read_register_list(self.CONFIG_REGISTER, 2)
+        return ("write", self.CONFIG_REGISTER, self._divide_into_bytes(word))
 
-        cfg[0] &= 11110001
-        cfg[0] |= self.RANGES[full_scale_range] << 1
+    def set_differential_mode(self, channel1: int = 0, channel2: int = 1) -> None:
+        self.configure(self._config.replace(mux=(channel1, channel2)))
 
-        self._bus.write_register_list(self.CONFIG_REGISTER, cfg)
+    def set_single_channel(self, channel: int = 0) -> None:
+        self.configure(self._config.replace(mux=channel))
 
-        self._full_range = full_scale_range
+    def set_data_range(self, full_scale_range: float = 2.048) -> None:
+        self.configure(self._config.replace(full_range=full_scale_range))
 
     def set_continuous(self, continuous: bool = True) -> None:
-        # TODO: checks
-        cfg = self._bus.read_register_list(self.CONFIG_REGISTER, 2)
-
-        cfg[0] &= 11111110
-        cfg[0] |= 0 if continuous else 1
-
-        self._bus.write_register_list(self.CONFIG_REGISTER, cfg)
+        self.configure(self._config.replace(continuous=continuous))
 
     def set_data_rate(self, data_rate: int = 1600) -> None:
-        # TODO: checks
-        cfg = self._bus.read_register_list(self.CONFIG_REGISTER, 2)
-
-        cfg[1] &= 0b11111000
-        cfg[1] |= self.DATARATES[data_rate] << 5
-
-        self._bus.write_register_list(self.CONFIG_REGISTER, cfg)
+        self.configure(self._config.replace(data_rate=data_rate))
 
     def set_alert_ready_polarity(self, polarity=0) -> None:
-        cfg = self._bus.read_register_list(self.CONFIG_REGISTER, 2)
-
-        cfg[1] &= 0b11110111
-        cfg[1] |= polarity << 3
-
-        self._bus.write_register_list(self.CONFIG_REGISTER, cfg)
+        self.configure(self._config.replace(comp_polarity=polarity))
 
     def set_comp_mode_traditional(self) -> None:
-        cfg = self._bus.read_register_list(self.CONFIG_REGISTER, 2)
-
-        cfg[1] &= 0b11101111
-
-        self._bus.write_register_list(self.CONFIG_REGISTER, cfg)
+        self.configure(self._config.replace(comp_window=False))
 
     def set_comp_mode_window(self) -> None:
-        cfg = self._bus.read_register_list(self.CONFIG_REGISTER, 2)
-
-        cfg[1] |= 0b1 << 4
-
-        self._bus.write_register_list(self.CONFIG_REGISTER, cfg)
+        self.configure(self._config.replace(comp_window=True))
 
     def enable_latching_comparator(self, latch=True) -> None:
-        cfg = self._bus.read_register_list(self.CONFIG_REGISTER, 2)
-
-        cfg[1] &= 0b11111011
-        if latch:
-            cfg[1] |= 1 << 2
-
-        self._bus.write_register_list(self.CONFIG_REGISTER, cfg)
+        self.configure(self._config.replace(comp_latch=latch))
 
     def set_comparator_queue(self, length=0) -> None:
-        cfg = self._bus.read_register_list(self.CONFIG_REGISTER, 2)
-
-        cfg[1] &= 0b11111100
-        if length != 0:
-            cfg[1] |= length - 1
-        else:
-            cfg[1] |= 3
-
-        self._bus.write_register_list(self.CONFIG_REGISTER, cfg)
+        self.configure(self._config.replace(comp_queue=length))
 
     # TODO: make this use V units rather than hex/binary
+    # Thresholds are 12 bit, left-justified like the conversion register
     def set_lo_thresh(self, value=0x800) -> None:
-        thresh_in_bytes = self._divide_into_bytes(value)
-
-        self._bus.write_register_list(self.LO_THRESH_REGISTER, thresh_in_bytes)
+        self._write_threshold(self.LO_THRESH_REGISTER, value)
 
     def set_hi_thresh(self, value=0x7FF) -> None:
-        thresh_in_bytes = self._divide_into_bytes(value)
+        self._write_threshold(self.HI_THRESH_REGISTER, value)
 
-        self._bus.write_register_list(self.HI_THRESH_REGISTER, thresh_in_bytes)
-
-    # starts continuous conversion
-    def start_continuous(self) -> None:
-        cfg = self._bus.read_register_list(self.CONFIG_REGISTER, 2)
+    def _write_threshold(self, register: int, value: int) -> None:
+        if not 0 <= value <= 0xFFF:
+            raise Exception("Threshold must be a 12 bit value")
 
-        cfg[0] |= 0x80
+        if self._thresholds[register] == value:
+            return
 
-        self._bus.write_register_list(self.CONFIG_REGISTER, cfg)
+        self._bus.write_register_list(register, self._divide_into_bytes(value << 4))
+        self._thresholds[register] = value
 
-    def start_singleshot(self) -> None:
-        cfg = self._bus.read_register_list(self.CONFIG_REGISTER, 2)
+    def enable_conversion_ready_pin(self, enable: bool = True) -> None:
+        # With the comparator on, a set high threshold MSB and a clear low
+        # threshold MSB turn ALERT/RDY into a conversion ready pulse
+        if enable:
+            self.set_hi_thresh(0x800)
+            self.set_lo_thresh(0x000)
+            self.set_comparator_queue(1)
+        else:
+            self.set_lo_thresh()
+            self.set_hi_thresh()
+            self.set_comparator_queue(0)
 
-        cfg[0] |= 0x81
+    # starts continuous conversion
+    def start_continuous(self) -> None:
+        self.configure(self._config.replace(continuous=True), start=True)
 
-        self._bus.write_register_list(self.CONFIG_REGISTER, cfg)
+    def start_singleshot(self) -> None:
+        self.configure(self._config.replace(continuous=False), start=True)
 
     def start_adc(self) -> None:
-        if self._continuous_mode:
-            self.start_continuous()
-        else:
-            self.start_singleshot()
+        self.configure(self._config, start=True)
 
     # TODO: stop conversions
     def stop(self) -> None:
         # set config register to default
-        self._bus.write_register_list(
-            self.CONFIG_REGISTER, self.CONFIG_REGISTER_DEFAULT
-        )
+        self.configure(ADS1015Config())
 
     def new_data_available(self) -> bool:
+        # The OS bit reflects the conversion status, the shadow copy can't be used
+        self._bus.invalidate(self.CONFIG_REGISTER)
         cfg = self._bus.read_register_list(self.CONFIG_REGISTER, 2)
 
-        return cfg[0] >> 15
+        return bool(cfg[0] >> 7)
+
+    def conversion_time(self) -> float:
+        # Worst case time (s) for a single-shot conversion to complete
+        period = 1 / self._config.data_rate
+
+        return period * (1 + self.DATARATE_TOLERANCE) + self.WAKEUP_TIME
+
+    def start_single_conversion(self, channel: int) -> None:
+        # Switches the multiplexer to a single-ended channel and starts a
+        # single-shot conversion on it, in one config register write
+        self.configure(self._config.replace(mux=channel, continuous=False), start=True)
+
+    def read_and_start_conversion(self, channel: int) -> float:
+        # read() of the finished conversion and start_single_conversion() of
+        # the next one, in one bus transaction
+        raw = self._read_raw_and_start(channel)
+
+        return self._sensor_raw_value_to_v(self._combine_bytes(raw[0], raw[1], 12))
+
+    def _read_raw_and_start(self, channel: int) -> list[int]:
+        start = self._config_message(
+            self._config.replace(mux=channel, continuous=False), start=True
+        )
+        raw, _ = self._bus.batch([("read", self.CONVERSION_REGISTER, 2), start])
+
+        return raw
+
+    @contextmanager
+    def preserved_config(self) -> Iterator[None]:
+        # Puts the config register back as it was once the block exits, e.g.
+        # the multiplexer and mode after a scan
+        saved = self._config
+        try:
+            yield
+        finally:
+            self.configure(saved)
+
+    def scan(
+        self, channels: Iterable[int], rounds: int = 1
+    ) -> dict[int, tuple[np.ndarray, np.ndarray]]:
+        # Round-robins single-shot conversions over channels, each read as
+        # soon as it is guaranteed to be done. Returns channel ->
+        # (monotonic ns timestamps, volts), timestamps are conversion midpoints.
+        channels = list(channels)
+        conversion = self.conversion_time()
+        conversion_ns = int(conversion * 1e9)
+
+        order = channels * rounds
+        timestamps = np.empty(len(order), dtype=np.int64)
+        frames = bytearray()
+        with self.preserved_config():
+            self.start_single_conversion(order[0])
+
+            for i in range(len(order)):
+                timestamps[i] = time.monotonic_ns() + conversion_ns // 2
+                time.sleep(conversion)
+
+                if i + 1 < len(order):
+                    frames += bytes(self._read_raw_and_start(order[i + 1]))
+                else:
+                    frames += self._bus.read_register_bytes(
+                        self.CONVERSION_REGISTER, 2
+                    )
+
+        timestamps = timestamps.reshape(rounds, len(channels))
+
+        values = self.decode_frames(frames).reshape(rounds, len(channels))
+
+        return {
+            channel: (timestamps[:, j].copy(), values[:, j].copy())
+            for j, channel in enumerate(channels)
+        }
 
     def read(self) -> float:
-        raw_diff = self._bus.read_register_list(self.CONVERSION_REGISTER, 2)
+        raw_diff = self._bus.read_register_bytes(self.CONVERSION_REGISTER, 2)
         final = self._combine_bytes(raw_diff[0], raw_diff[1], 12)
 
         return self._sensor_raw_value_to_v(final)
 
+    def decode_frames(self, frames: RawFrames) -> np.ndarray:
+        # Batch conversion of raw conversion register reads to V, see decode_ads1015
+        return decode_ads1015(frames, self._config.full_range)
+
     # TODO: ADC gain setters
     def _sensor_raw_value_to_v(self, value: int) -> float:
         # convert two's complement
         max_value = 2**12
-        if value > max_value / 2:
+        if value >= max_value / 2:
             value -= max_value
 
-        return (value * self._full_range * 2) / (max_value)
+        return (value * self._config.full_range * 2) / (max_value)
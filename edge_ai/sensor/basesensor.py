@@ -1,13 +1,16 @@
 from __future__ import annotations
 
 from abc import ABC, abstractmethod
-from textwrap import wrap
+from contextlib import AbstractContextManager
 from typing import Any, Type
 
 from ..bus import BaseBus
 
 
 class BaseSensor(ABC):
+    # Configuration registers that are safe to shadow in the bus cache
+    CACHEABLE_REGISTERS = []
+
     def __init__(self, bus: Type[BaseBus]) -> None:
         self._bus = bus
         self._running = False
@@ -24,11 +27,8 @@ class BaseSensor(ABC):
 
     @staticmethod
     def _divide_into_bytes(num: int) -> list[int]:
-        binstring = bin(num)[2:]
-
-        bytestrings = wrap(binstring, 8)
-
-        return [int(x) for x in bytestrings]
+        # 16 bit register value, MSB first
+        return [(num >> 8) & 0xFF, num & 0xFF]
 
     def start(self) -> None:
         if self._running:
@@ -44,6 +44,20 @@ class BaseSensor(ABC):
         self._bus.stop()
         self._running = False
 
+    def enable_register_cache(self) -> None:
+        self._bus.enable_cache(self.CACHEABLE_REGISTERS)
+
+    def enable_bus_stats(self) -> None:
+        self._bus.enable_stats()
+
+    def bus_stats(self, reset: bool = False) -> dict[str, Any] | None:
+        # Transactions issued to the sensor, see BusStats
+        return self._bus.stats(reset)
+
+    def deferred_writes(self) -> AbstractContextManager[None]:
+        # Coalesces consecutive setter calls into one write per register
+        return self._bus.deferred_writes()
+
     @abstractmethod
     def read(self) -> Any:
         ...
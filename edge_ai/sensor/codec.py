@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+from typing import Sequence, Union
+
+import numpy as np
+
+# Raw register bytes as returned by a bus, or any bytes-like buffer
+RawFrames = Union[bytes, bytearray, memoryview, Sequence[int], np.ndarray]
+
+
+def _as_bytes(frames: RawFrames) -> np.ndarray:
+    if isinstance(frames, (bytes, bytearray, memoryview)):
+        return np.frombuffer(frames, dtype=np.uint8)
+
+    return np.asarray(frames, dtype=np.uint8)
+
+
+def decode_lis3dh(
+    frames: RawFrames,
+    bits: int,
+    measurement_range: int,
+    frame_size: int = 6,
+    offset: int = 0,
+) -> np.ndarray:
+    """
+    Converts back-to-back LIS3DH output frames to an (n, 3) array of g.
+    Each frame is frame_size bytes with OUT_X_L..OUT_Z_H starting at offset,
+    e.g. frame_size=7, offset=1 for frames that start with STATUS_REG.
+    Values are left-justified little-endian two's complement of `bits` bits.
+    """
+    raw = _as_bytes(frames).reshape(-1, frame_size)
+
+    if frame_size != 6 or offset != 0:
+        raw = np.ascontiguousarray(raw[:, offset : offset + 6])
+
+    # Arithmetic shift drops the padding bits and keeps the sign
+    values = raw.view("<i2") >> (16 - bits)
+
+    return values * (measurement_range / 2 ** (bits - 1))
+
+
+def decode_ads1015(frames: RawFrames, full_range: float, bits: int = 12) -> np.ndarray:
+    """
+    Converts back-to-back ADS1015 conversion register reads to an array of
+    volts. Values are left-justified big-endian two's complement of `bits` bits.
+    """
+    values = _as_bytes(frames).view(">i2") >> (16 - bits)
+
+    return values * (full_range / 2 ** (bits - 1))
+
+
+def magnitudes(values: np.ndarray) -> np.ndarray:
+    # Euclidean norm of every row of an (n, 3) array
+    values = np.asarray(values, dtype=np.float64)
+
+    return np.sqrt(np.einsum("ij,ij->i", values, values))
@@ -0,0 +1,5 @@
+from .pgcopy import encode_copy_binary
+from .rts import RTSClient
+from .section import Section
+from .spool import Spool
+from .writer import DatabaseWriter
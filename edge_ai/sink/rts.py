@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+import gzip
+import io
+import json
+import logging
+from typing import Any
+
+import numpy as np
+
+from .section import Section
+
+PAYLOAD_FORMATS = ("npz", "json")
+COMPRESSIONS = ("none", "gzip", "zstd")
+
+
+class RTSClient:
+    """
+    Uploads batches of sections to the real-time scoring server over one
+    persistent HTTP session, so connections are kept alive between uploads.
+
+    With payload_format "npz" a batch is sent as NumPy .npz arrays, one
+    column per array: section_id, device_id, utc_offset (us) and offsets
+    (start of every section in the sample columns, plus the end) per
+    section, then times (local datetime64[us]) and gravity per sample.
+    "json" is the original row-per-sample {"data": [...]} payload, and the
+    default along with no compression, as that is what the server accepts
+    until it supports the others. Bodies can be gzip or zstd (needs the
+    zstandard package) compressed, with the matching Content-Encoding.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        username: str = "",
+        password: str = "",
+        payload_format: str = "json",
+        compression: str = "none",
+        timeformat: str = "%Y-%m-%d %H:%M:%S.%f",
+        timeout: float = 30.0,
+    ) -> None:
+        if payload_format not in PAYLOAD_FORMATS:
+            raise Exception(
+                f'Payload format must be one of {", ".join(PAYLOAD_FORMATS)}'
+            )
+        if compression not in COMPRESSIONS:
+            raise Exception(f'Compression must be one of {", ".join(COMPRESSIONS)}')
+
+        self._url = url
+        self._auth = (username, password) if username else None
+        self._payload_format = payload_format
+        self._compression = compression
+        self._timeformat = timeformat
+        self._timeout = timeout
+
+        self._session = None
+
+    def upload(self, batch: list[tuple[int, Section]]) -> None:
+        # Raises if the upload fails, so the batch stays spooled
+        if self._url == "":
+            raise Exception("No RTS URL set. Will not attempt to POST.")
+
+        body, headers = self.encode(batch)
+
+        res = self._get_session().post(
+            self._url, data=body, headers=headers, timeout=self._timeout
+        )
+        res.raise_for_status()
+
+        logging.info(
+            f"Wrote {len(batch)} sections ({len(body)} bytes) to RTS with response {res}"
+        )
+
+    def encode(self, batch: list[tuple[int, Section]]) -> tuple[bytes, dict[str, str]]:
+        if self._payload_format == "npz":
+            body = self._encode_npz(batch)
+            headers = {"Content-Type": "application/x-npz"}
+        else:
+            body = json.dumps({"data": self._records(batch)}).encode()
+            headers = {"Content-Type": "application/json"}
+
+        if self._compression == "gzip":
+            body = gzip.compress(body, compresslevel=6)
+            headers["Content-Encoding"] = "gzip"
+        elif self._compression == "zstd":
+            import zstandard
+
+            body = zstandard.ZstdCompressor().compress(body)
+            headers["Content-Encoding"] = "zstd"
+
+        return body, headers
+
+    def close(self) -> None:
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+    def _get_session(self) -> Any:
+        if self._session is None:
+            import requests
+
+            self._session = requests.Session()
+            self._session.auth = self._auth
+
+        return self._session
+
+    def _encode_npz(self, batch: list[tuple[int, Section]]) -> bytes:
+        sections = [section for _, section in batch]
+
+        stream = io.BytesIO()
+        np.savez(
+            stream,
+            section_id=np.array([id for id, _ in batch], dtype=np.int64),
+            device_id=np.array([section.device_id for section in sections], np.int64),
+            utc_offset=np.array([section.utc_offset for section in sections], np.int64),
+            offsets=np.cumsum([0] + [len(section) for section in sections]),
+            times=np.concatenate([section.times for section in sections]),
+            gravity=np.concatenate([section.gravities for section in sections]),
+        )
+
+        return stream.getvalue()
+
+    def _records(self, batch: list[tuple[int, Section]]) -> list[dict[str, Any]]:
+        records = []
+        for id, section in batch:
+            records.extend(
+                {"section_id": id, "time": timestamp, "gravity": gravity}
+                for timestamp, gravity in zip(
+                    section.format_times(self._timeformat), section.gravities.tolist()
+                )
+            )
+
+        return records
@@ -0,0 +1,41 @@
+from __future__ import annotations
+
+import datetime
+from typing import Any
+
+import numpy as np
+
+
+class Section:
+    """
+    One completed measurement window, ready to be written out.
+    times are naive local datetime64[us] (what the gravities table stores),
+    utc_offset is the local time zone offset in microseconds.
+    metadata is the capture's metadata (configured and achieved rate,
+    overruns, largest gap), stored with the section if the writer is set up
+    to, so it has to be JSON serializable.
+    """
+
+    def __init__(
+        self,
+        device_id: int,
+        times: np.ndarray,
+        gravities: np.ndarray,
+        utc_offset: int = 0,
+        metadata: dict[str, Any] | None = None,
+    ) -> None:
+        self.device_id = device_id
+        self.times = times
+        self.gravities = gravities
+        self.utc_offset = utc_offset
+        self.metadata = metadata if metadata is not None else {}
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    @property
+    def start_time(self) -> datetime.datetime:
+        return self.times[0].item()
+
+    def format_times(self, timeformat: str) -> list[str]:
+        return [f"{time:{timeformat}}" for time in self.times.tolist()]
@@ -0,0 +1,308 @@
+from __future__ import annotations
+
+import json
+import mmap
+import os
+import struct
+import threading
+
+import numpy as np
+
+from .section import Section
+
+
+class _Segment:
+    # One memory-mapped spool file: a header with the write and read offsets
+    # (int64 each), then entries back to back
+
+    HEADER_SIZE = 16
+
+    def __init__(self, path: str, size: int, create: bool = False) -> None:
+        # Existing files keep their size, unless a crash while creating one
+        # left it shorter than the header (or its header unwritten), in
+        # which case it is set up again from scratch like a new one
+        self.path = path
+
+        with open(path, "a+b") as f:
+            if create or os.fstat(f.fileno()).st_size < self.HEADER_SIZE:
+                create = True
+                f.truncate(size)
+            self._mmap = mmap.mmap(f.fileno(), 0)
+
+        self.size = len(self._mmap)
+        self._offsets = np.ndarray((2,), dtype="<i8", buffer=self._mmap)
+
+        if create or self.write_offset < self.HEADER_SIZE:
+            self._offsets[:] = self.HEADER_SIZE
+            self._mmap.flush(0, self.HEADER_SIZE)
+
+    @property
+    def write_offset(self) -> int:
+        return int(self._offsets[0])
+
+    @property
+    def read_offset(self) -> int:
+        return int(self._offsets[1])
+
+    def append(self, parts: list[bytes | memoryview]) -> int:
+        start = offset = self.write_offset
+        for part in parts:
+            self._mmap[offset : offset + len(part)] = part
+            offset += len(part)
+
+        # entries become visible only once they are on disk in full, only
+        # the pages written to are synced (from a page boundary)
+        page = start - start % mmap.PAGESIZE
+        self._mmap.flush(page, offset - page)
+        self._offsets[0] = offset
+        self._mmap.flush(0, self.HEADER_SIZE)
+
+        return offset
+
+    def release(self, offset: int) -> None:
+        self._offsets[1] = offset
+        self._mmap.flush(0, self.HEADER_SIZE)
+
+    def read(self, offset: int, size: int) -> memoryview:
+        return memoryview(self._mmap)[offset : offset + size]
+
+    def close(self) -> None:
+        del self._offsets
+        self._mmap.close()
+
+
+class Spool:
+    """
+    Append-only on-disk queue of sections, kept in memory-mapped segment
+    files under path, so sections survive the backend (and the script)
+    going down until they are written.
+    Entries are a fixed header (length, device id, sample count, metadata
+    length, UTC offset) followed by the int64 times (datetime64[us]), the
+    float64 gravities and the metadata as JSON.
+    Positions returned by append and read are absolute and increasing, so
+    release(position) drops everything up to and including that entry.
+    Safe to share between one appending and one reading thread.
+    The database ids of sections committed but not yet released (e.g. not
+    uploaded yet) are kept in a side file, so they survive a restart too.
+    """
+
+    # metadata length took the place of padding, which older entries left 0
+    ENTRY = struct.Struct("<IiIIq")
+
+    # segment number and offset within the segment
+    OFFSET_BITS = 40
+
+    # position and section id, appended to the committed file
+    COMMITTED = struct.Struct("<qq")
+
+    def __init__(self, path: str, segment_size: int = 64 * 2**20) -> None:
+        self._path = path
+        self._segment_size = segment_size
+        self._lock = threading.Lock()
+
+        os.makedirs(path, exist_ok=True)
+
+        numbers = sorted(
+            int(name.split(".")[0])
+            for name in os.listdir(path)
+            if name.endswith(".spool")
+        )
+
+        self._segments = {
+            number: _Segment(self._segment_path(number), segment_size)
+            for number in numbers
+        }
+        if not self._segments:
+            self._segments[0] = _Segment(
+                self._segment_path(0), segment_size, create=True
+            )
+
+        self._count = sum(
+            len(self._entries(number, segment.read_offset, segment.write_offset))
+            for number, segment in self._segments.items()
+        )
+
+        self._committed = self._load_committed()
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    def __len__(self) -> int:
+        # Sections appended and not yet released
+        return self._count
+
+    def append(self, section: Section) -> int:
+        times = np.ascontiguousarray(section.times, dtype="datetime64[us]")
+        gravities = np.ascontiguousarray(section.gravities, dtype="<f8")
+
+        metadata = json.dumps(section.metadata).encode() if section.metadata else b""
+
+        length = self.ENTRY.size + 16 * len(section) + len(metadata)
+        parts = [
+            self.ENTRY.pack(
+                length,
+                section.device_id,
+                len(section),
+                len(metadata),
+                section.utc_offset,
+            ),
+            memoryview(times.view("<i8")).cast("B"),
+            memoryview(gravities).cast("B"),
+            metadata,
+        ]
+
+        with self._lock:
+            number = max(self._segments)
+            segment = self._segments[number]
+
+            if segment.write_offset + length > segment.size:
+                # sections never span segments, a large one gets a larger file
+                number += 1
+                size = max(self._segment_size, _Segment.HEADER_SIZE + length)
+                segment = _Segment(self._segment_path(number), size, create=True)
+                self._segments[number] = segment
+
+            offset = segment.append(parts)
+            self._count += 1
+
+        return (number << self.OFFSET_BITS) | offset
+
+    def read(self, max_sections: int) -> list[tuple[int, Section]]:
+        # Oldest sections still in the spool, as copies, with their positions
+        sections = []
+
+        with self._lock:
+            for number in sorted(self._segments):
+                segment = self._segments[number]
+                entries = self._entries(
+                    number, segment.read_offset, segment.write_offset
+                )
+
+                for offset, end in entries[: max_sections - len(sections)]:
+                    position = (number << self.OFFSET_BITS) | end
+                    sections.append((position, self._decode(segment, offset)))
+
+                if len(sections) >= max_sections:
+                    break
+
+        return sections
+
+    def set_committed(self, ids: dict[int, int]) -> None:
+        # Records the database ids of spooled sections, by position
+        data = b"".join(
+            self.COMMITTED.pack(position, id) for position, id in ids.items()
+        )
+
+        with self._lock:
+            with open(self._committed_path(), "ab") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+
+            self._committed.update(ids)
+
+    def committed(self, position: int) -> int | None:
+        # Database id of a spooled section, None if not committed yet
+        with self._lock:
+            return self._committed.get(position)
+
+    def release(self, position: int) -> None:
+        number = position >> self.OFFSET_BITS
+        end = position & ((1 << self.OFFSET_BITS) - 1)
+
+        with self._lock:
+            for older in sorted(self._segments):
+                segment = self._segments[older]
+                if older > number:
+                    break
+
+                stop = end if older == number else segment.write_offset
+                self._count -= len(self._entries(older, segment.read_offset, stop))
+                segment.release(stop)
+
+                # drained segments are deleted, except the one being appended to
+                if stop == segment.write_offset and older != max(self._segments):
+                    segment.close()
+                    os.remove(segment.path)
+                    del self._segments[older]
+
+            released = [older for older in self._committed if older <= position]
+            if released:
+                for older in released:
+                    del self._committed[older]
+                self._write_committed()
+
+    def close(self) -> None:
+        with self._lock:
+            for segment in self._segments.values():
+                segment.close()
+
+            self._segments.clear()
+
+    def _segment_path(self, number: int) -> str:
+        return os.path.join(self._path, f"{number:08d}.spool")
+
+    def _committed_path(self) -> str:
+        return os.path.join(self._path, "committed")
+
+    def _load_committed(self) -> dict[int, int]:
+        try:
+            with open(self._committed_path(), "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return {}
+
+        # a record cut short by a crash is dropped
+        size = self.COMMITTED.size
+        data = data[: len(data) - len(data) % size]
+
+        return dict(self.COMMITTED.iter_unpack(data))
+
+    def _write_committed(self) -> None:
+        # Replaced as a whole, so a crash leaves either version
+        path = self._committed_path()
+        with open(path + ".tmp", "wb") as f:
+            for position, id in self._committed.items():
+                f.write(self.COMMITTED.pack(position, id))
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.replace(path + ".tmp", path)
+
+    def _entries(self, number: int, start: int, stop: int) -> list[tuple[int, int]]:
+        # (offset, end) of the entries between two offsets of a segment
+        segment = self._segments[number]
+
+        entries = []
+        while start < stop:
+            length = self.ENTRY.unpack_from(segment.read(start, self.ENTRY.size))[0]
+            entries.append((start, start + length))
+            start += length
+
+        return entries
+
+    def _decode(self, segment: _Segment, offset: int) -> Section:
+        _, device_id, count, metadata_length, utc_offset = self.ENTRY.unpack_from(
+            segment.read(offset, self.ENTRY.size)
+        )
+        offset += self.ENTRY.size
+
+        times = np.frombuffer(segment.read(offset, 8 * count), dtype="<i8")
+        gravities = np.frombuffer(
+            segment.read(offset + 8 * count, 8 * count), dtype="<f8"
+        )
+
+        metadata = None
+        if metadata_length:
+            metadata = json.loads(
+                bytes(segment.read(offset + 16 * count, metadata_length))
+            )
+
+        return Section(
+            device_id,
+            times.astype("datetime64[us]"),
+            gravities.copy(),
+            utc_offset,
+            metadata,
+        )
@@ -0,0 +1,410 @@
+from __future__ import annotations
+
+import csv
+import io
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable
+
+import numpy as np
+
+from .pgcopy import TEXT_TYPES, TYPES, encode_copy_binary
+from .section import Section
+from .spool import Spool
+
+
+class DatabaseWriter:
+    """
+    Writes completed sections to Postgres from a background thread.
+    submit() appends the section to the on-disk spool before any network
+    I/O and returns, so the acquisition loop goes straight back to waiting
+    for the next trigger. The thread drains the spool in batches of up to
+    batch_size sections: one INSERT into sections for the whole batch, then
+    either one COPY of all their gravities in the same transaction or, if
+    an upload callable is given, one upload of the batch with the section
+    ids once they are committed. Ids of sections whose upload failed are
+    kept in the spool, so a retry (even after a restart) uploads them again
+    without inserting them twice. A
+    batch is only released from the spool once committed (and uploaded);
+    on failure the connection is dropped and retried with exponential
+    backoff, so a backlog (including one left over from a previous run) is
+    cleared in a few large writes once the backend is back. A batch that is
+    rejected (rather than the backend being unreachable) max_attempts times
+    in a row is split up to find the sections that fail, which are moved to
+    the dead spool in the spool's directory, so they do not hold up the rest.
+
+    gravities_types lists the Postgres type of each gravities column in
+    table order (section id, time, gravity). With copy_format "binary" the
+    rows are sent in binary COPY format, "csv" falls back to text. A text
+    time column is filled with the times formatted with timeformat either
+    way.
+    With store_metadata, each section's capture metadata is also inserted,
+    as JSON, into the metadata column (json or jsonb) of sections.
+    """
+
+    def __init__(
+        self,
+        connect: Callable[[], Any],
+        spool: Spool,
+        gravities_types: list[str],
+        copy_format: str = "binary",
+        timeformat: str = "%Y-%m-%d %H:%M:%S.%f",
+        upload: Callable[[list[tuple[int, Section]]], None] | None = None,
+        batch_size: int = 64,
+        max_backoff: float = 60.0,
+        store_metadata: bool = False,
+        max_attempts: int = 5,
+    ) -> None:
+        if copy_format not in ("binary", "csv"):
+            raise Exception('COPY format must be "binary" or "csv"')
+
+        if copy_format == "binary":
+            # fail on start rather than on the first write
+            for pgtype in gravities_types:
+                if pgtype not in TYPES.keys() and pgtype not in TEXT_TYPES:
+                    raise Exception(
+                        f"Cannot binary COPY gravities column type {pgtype}, "
+                        f'use copy_format "csv"'
+                    )
+
+        self._connect = connect
+        self._spool = spool
+        self._gravities_types = gravities_types
+        self._copy_format = copy_format
+        self._timeformat = timeformat
+        self._upload = upload
+        self._batch_size = batch_size
+        self._max_backoff = max_backoff
+        self._store_metadata = store_metadata
+        self._max_attempts = max_attempts
+
+        self._conn = None
+
+        # failed attempts at the oldest batch, and where sections that cannot
+        # be written end up (opened on first use)
+        self._attempts = 0
+        self._dead = None
+
+        # spool position -> future of sections submitted and not yet written.
+        # The lock keeps appending and registering the future atomic with
+        # respect to reading the spool.
+        self._futures = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = False
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+        self._flush_latency = None
+        self._total_latency = 0.0
+        self._flushes = 0
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self, timeout: float | None = None) -> None:
+        # Makes a last attempt at writing what is spooled, then ends the thread.
+        # Sections that could not be written stay in the spool for next time.
+        if not self._thread.is_alive():
+            raise Exception("Attempted to stop writer before starting")
+
+        self._stopping = True
+        self._wakeup.set()
+        self._thread.join(timeout)
+
+    def submit(self, section: Section) -> Future:
+        # Future resolves to the section id once the section is written
+        future = Future()
+        with self._lock:
+            self._futures[self._spool.append(section)] = future
+
+        self._wakeup.set()
+
+        return future
+
+    @property
+    def queue_depth(self) -> int:
+        # Sections spooled and not yet written
+        return len(self._spool)
+
+    @property
+    def flush_latency(self) -> float | None:
+        # Seconds the latest batch took to write
+        return self._flush_latency
+
+    @property
+    def mean_flush_latency(self) -> float | None:
+        if self._flushes == 0:
+            return None
+
+        return self._total_latency / self._flushes
+
+    def _run(self) -> None:
+        backoff = 1.0
+        retry_at = 0.0
+
+        while True:
+            timeout = None
+            if len(self._spool):
+                timeout = max(0.0, retry_at - time.monotonic())
+
+            self._wakeup.wait(timeout)
+            self._wakeup.clear()
+
+            if not self._stopping and time.monotonic() < retry_at:
+                continue
+
+            if self._drain():
+                backoff = 1.0
+            else:
+                retry_at = time.monotonic() + backoff
+                backoff = min(2 * backoff, self._max_backoff)
+
+            if self._stopping:
+                break
+
+        with self._lock:
+            for future in self._futures.values():
+                future.set_exception(
+                    Exception("Section was not written, it is spooled")
+                )
+            self._futures.clear()
+
+        self._disconnect()
+
+        if self._dead is not None:
+            self._dead.close()
+
+    def _drain(self) -> bool:
+        # Writes out the spool batch by batch, False if the backend failed
+        while len(self._spool):
+            with self._lock:
+                batch = self._spool.read(self._batch_size)
+
+            start = time.perf_counter()
+            try:
+                if self._attempts < self._max_attempts:
+                    ids = self._write(batch)
+                else:
+                    self._isolate(batch)
+                    self._attempts = 0
+                    continue
+            except Exception as e:
+                logging.warning(f"Could not write {len(batch)} spooled sections: {e}")
+                self._disconnect()
+
+                # retried as is for as long as the backend is unreachable
+                if not _is_transient(e):
+                    self._attempts += 1
+                return False
+
+            self._attempts = 0
+            self._written(batch, ids)
+
+            self._flush_latency = time.perf_counter() - start
+            self._total_latency += self._flush_latency
+            self._flushes += 1
+
+        return True
+
+    def _written(self, batch: list[tuple[int, Section]], ids: list[int]) -> None:
+        self._spool.release(batch[-1][0])
+
+        logging.info(f'Wrote sections {", ".join(str(id) for id in ids)}')
+
+        with self._lock:
+            for (position, _), id in zip(batch, ids):
+                future = self._futures.pop(position, None)
+                if future is not None:
+                    future.set_result(id)
+
+    def _isolate(self, batch: list[tuple[int, Section]]) -> None:
+        # Writes the batch in halves, in order, down to the single sections
+        # that still fail, which are moved to the dead spool
+        try:
+            ids = self._write(batch)
+        except Exception as e:
+            self._disconnect()
+            if _is_transient(e):
+                raise
+
+            if len(batch) > 1:
+                self._isolate(batch[: len(batch) // 2])
+                self._isolate(batch[len(batch) // 2 :])
+            else:
+                self._bury(*batch[0], e)
+            return
+
+        self._written(batch, ids)
+
+    def _bury(self, position: int, section: Section, error: Exception) -> None:
+        if self._dead is None:
+            self._dead = Spool(os.path.join(self._spool.path, "dead"))
+
+        self._dead.append(section)
+        self._spool.release(position)
+
+        logging.error(
+            f"Gave up on writing a section of device {section.device_id} "
+            f"starting at {section.start_time}, moved it to {self._dead.path}: "
+            f"{error}"
+        )
+
+        with self._lock:
+            future = self._futures.pop(position, None)
+            if future is not None:
+                future.set_exception(
+                    Exception(f"Section could not be written: {error}")
+                )
+
+    def _disconnect(self) -> None:
+        # the connection is set up again on the next attempt
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+
+        self._conn = None
+
+    def _write(self, batch: list[tuple[int, Section]]) -> list[int]:
+        new = [
+            (position, section)
+            for position, section in batch
+            if self._spool.committed(position) is None
+        ]
+
+        if new:
+            if self._conn is None:
+                self._conn = self._connect()
+
+            sections = [section for _, section in new]
+
+            cursor = self._conn.cursor()
+            try:
+                ids = self._insert_sections(cursor, sections)
+
+                if self._upload is None:
+                    self._copy_gravities(cursor, ids, sections)
+
+                self._conn.commit()
+            finally:
+                cursor.close()
+
+            if self._upload is None:
+                return ids
+
+            self._spool.set_committed(
+                {position: id for (position, _), id in zip(new, ids)}
+            )
+
+        # the server only gets sections that are in the database
+        ids = [self._spool.committed(position) for position, _ in batch]
+        self._upload([(id, section) for id, (_, section) in zip(ids, batch)])
+
+        return ids
+
+    def _insert_sections(self, cursor: Any, sections: list[Section]) -> list[int]:
+        from psycopg2.extras import execute_values
+
+        # write to section table, get section ids (in the order of the rows)
+        if self._store_metadata:
+            query = (
+                "INSERT INTO sections (device_id, start_time, metadata) "
+                "VALUES %s RETURNING id;"
+            )
+            values = [
+                (section.device_id, section.start_time, json.dumps(section.metadata))
+                for section in sections
+            ]
+        else:
+            query = (
+                "INSERT INTO sections (device_id, start_time) VALUES %s RETURNING id;"
+            )
+            values = [(section.device_id, section.start_time) for section in sections]
+
+        rows = execute_values(
+            cursor, query, values, page_size=len(sections), fetch=True
+        )
+
+        return [row[0] for row in rows]
+
+    def _copy_gravities(
+        self, cursor: Any, ids: list[int], sections: list[Section]
+    ) -> None:
+        section_ids = np.repeat(ids, [len(section) for section in sections])
+        gravities = np.concatenate([section.gravities for section in sections])
+
+        if self._copy_format == "binary":
+            stream = io.BytesIO(self._encode_binary(section_ids, sections, gravities))
+            cursor.copy_expert("COPY gravities FROM STDIN WITH (FORMAT binary)", stream)
+        else:
+            times = []
+            for section in sections:
+                times.extend(section.format_times(self._timeformat))
+
+            stream = io.StringIO()
+            csv.writer(stream).writerows(
+                zip(section_ids.tolist(), times, gravities.tolist())
+            )
+            stream.seek(0)
+            cursor.copy_from(stream, "gravities", sep=",")
+
+    def _encode_binary(
+        self, section_ids: np.ndarray, sections: list[Section], gravities: np.ndarray
+    ) -> bytes:
+        id_type, time_type, gravity_type = self._gravities_types
+
+        if time_type in TEXT_TYPES:
+            times = []
+            for section in sections:
+                times.extend(section.format_times(self._timeformat))
+        elif time_type == "timestamptz":
+            times = np.concatenate(
+                [
+                    section.times - np.timedelta64(section.utc_offset, "us")
+                    for section in sections
+                ]
+            )
+        else:
+            times = np.concatenate([section.times for section in sections])
+
+        return encode_copy_binary(
+            [
+                (id_type, section_ids),
+                (time_type, times),
+                (gravity_type, gravities),
+            ]
+        )
+
+
+def _is_transient(error: Exception) -> bool:
+    # Whether the backend could not be reached, as opposed to it rejecting
+    # what was sent
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+
+    try:
+        import requests
+
+        if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+            return True
+        if isinstance(error, requests.HTTPError) and error.response is not None:
+            # gateway errors and an overloaded server
+            return error.response.status_code in (429, 502, 503, 504)
+    except ImportError:
+        pass
+
+    try:
+        import psycopg2
+
+        if isinstance(error, psycopg2.OperationalError):
+            return True
+    except ImportError:
+        pass
+
+    return False
@@ -1,15 +1,17 @@
 import argparse
 import os
-
-import daemon
-import daemon.pidfile
-
-import script
+import sys
+import time
 
 DAEMONPIDFILE = "daemon.pid"
 
 
 def start() -> None:
+    import daemon
+    import daemon.pidfile
+
+    import script
+
     path = os.path.dirname(__file__)
     context = daemon.DaemonContext(
         working_directory=path,
@@ -20,12 +22,37 @@ def start() -> None:
         script.main()
 
 
+def startup(budget: float) -> None:
+    # Cold start report, run in the foreground: time to import the script and
+    # to bring the sensors up, checked against a budget in seconds
+    start = time.perf_counter()
+    import script
+
+    phases = {"import": time.perf_counter() - start}
+    phases.update(script.measure_startup())
+
+    total = sum(phases.values())
+    for phase, seconds in phases.items():
+        print(f"{phase:<20}{seconds * 1000:>10.1f} ms")
+    print(f'{"total":<20}{total * 1000:>10.1f} ms (budget {budget * 1000:.0f} ms)')
+
+    if total > budget:
+        print("Startup is over budget")
+        sys.exit(1)
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument(
         "action",
-        choices=["start", "stop"],
-        help='"start" or "stop" the measurement script',
+        choices=["start", "stop", "startup"],
+        help='"start" or "stop" the measurement script, or time its "startup"',
+    )
+    parser.add_argument(
+        "--budget",
+        type=float,
+        default=2.0,
+        help="startup time budget in seconds",
     )
     args = parser.parse_args()
 
@@ -34,3 +61,5 @@ if __name__ == "__main__":
     elif args.action == "stop":
         path = os.path.dirname(__file__)
         os.system(f"cat {path}/{DAEMONPIDFILE} | xargs kill")
+    elif args.action == "startup":
+        startup(args.budget)
@@ -1,20 +1,18 @@
 from __future__ import annotations
 
-import io
 import json
 import logging
-import math
 import os
 import time
+from concurrent.futures import Future
+from typing import Callable
 
-import pandas as pd
-import psycopg2
-import psycopg2.extensions
-import requests
-from requests.auth import HTTPBasicAuth
-
+from edge_ai.controller import AcquisitionEngine, Capture
 from edge_ai.controller.accel import LIS3DH
 from edge_ai.controller.adc import ADS1015
+from edge_ai.pipeline import STOP, Pipeline, Source, Stage
+from edge_ai.sensor.codec import magnitudes
+from edge_ai.sink import DatabaseWriter, RTSClient, Section, Spool
 
 BASE_PATH = os.path.dirname(__file__)
 
@@ -26,88 +24,178 @@ def _parse_config() -> dict[str, any]:
     return config
 
 
-def _event_loop(
-    motionsensor: LIS3DH,
-    adc: ADS1015,
-    conn: psycopg2.extensions.connection,
-    config: dict[str, any],
-) -> int:
-    logging.info("Waiting for high ADC reading (Object Detection)")
-    while True:
-        time.sleep(config["adc_measurement_interval"])
-        val = adc.read()
-        if val > config["adc_threshold"]:
-            break
-    logging.info(f'Object detected. Waiting for {config["wait_time"]} seconds')
-
-    time.sleep(config["wait_time"])
-
-    logging.info(
-        f'Instructing motion sensor to read for {config["window_length"]} seconds'
-    )
-    values = motionsensor.read_for(
-        config["window_length"], timeformat=config["timeformat"]
-    )
-    results = [[row[0], math.sqrt(sum([x**2 for x in row[1]]))] for row in values]
+def _connect_to_database(config: dict[str, any]) -> Callable[[], any]:
+    def connect() -> any:
+        import psycopg2
 
-    logging.info(f"Finished reading motion sensor. {len(results)} lines recorded")
+        logging.info("Connecting to Postgres Database")
+        conn = psycopg2.connect(**config["rdb_access"])
+        logging.info("Successfuly connected to Postgres Database")
 
-    cursor = conn.cursor()
+        return conn
 
-    # write to section table, get section id
-    logging.info("Attempting to write to sections database")
-    cursor.execute(
-        "INSERT INTO sections (device_id, start_time) VALUES (%s, %s) RETURNING id;",
-        (config["device_id"], results[0][0]),
-    )
-    conn.commit()
-
-    id = cursor.fetchone()[0]
-    logging.info(f"Finished writing to sections database (Section {id})")
-
-    # Arrange data into correct columns
-    logging.info("Preparing data for copy")
-    final = pd.DataFrame(
-        data={
-            "section_id": [id] * len(results),
-            "time": [row[0] for row in results],
-            "gravity": [row[1] for row in results],
-        }
+    return connect
+
+
+def _detect_objects(adc: ADS1015, config: dict[str, any]) -> Callable[[], any]:
+    # Trigger stage: returns the monotonic time (ns) the next object showed up
+    # at, or STOP once number_measurements objects have been seen
+    detected = 0
+
+    def detect() -> any:
+        nonlocal detected
+
+        if config["number_measurements"] != "infinite":
+            if detected >= config["number_measurements"]:
+                return STOP
+
+        # the ADC controller evaluates the trigger at its data rate
+        logging.info("Waiting for high ADC reading (Object Detection)")
+        detected_at = adc.wait_for_trigger()
+
+        detected += 1
+        logging.info(f"Object {detected} detected")
+
+        return detected_at
+
+    return detect
+
+
+def _capture_window(
+    motionsensor: LIS3DH, config: dict[str, any]
+) -> Callable[[int], Capture]:
+    def capture(detected_at: int) -> Capture:
+        # copied out of the motion sensor's circular buffer once the window
+        # has passed, including the samples from before the detection
+        logging.info(
+            f'Instructing motion sensor to read from {config["pre_trigger"]} seconds '
+            f'before to {config["window_length"]} seconds after the detection'
+        )
+        capture = motionsensor.read_around(
+            detected_at, config["pre_trigger"], config["window_length"]
+        )
+        logging.info(
+            f"Finished reading motion sensor. {len(capture)} lines recorded, "
+            f"{_describe_capture(capture.metadata)}"
+        )
+
+        # samples were lost, the device cannot keep up with the data rate
+        if capture.metadata["overruns"]:
+            logging.warning(
+                f'Motion sensor overran {capture.metadata["overruns"]} times '
+                f"during the window"
+            )
+
+        return capture
+
+    return capture
+
+
+def _describe_capture(metadata: dict[str, any]) -> str:
+    # achieved rate and largest gap are None with fewer than two samples
+    achieved = metadata["achieved_rate"]
+    achieved = "-" if achieved is None else f"{achieved:.0f}"
+    max_gap = metadata["max_gap"]
+    max_gap = "-" if max_gap is None else f"{max_gap * 1000:.2f}"
+
+    return (
+        f'{achieved} of {metadata["datarate"]} Hz achieved, '
+        f'{metadata["overruns"]} overruns, largest gap {max_gap} ms'
     )
 
-    # Load data into a file-like object for copying
-    output_stream = io.StringIO()
 
-    # If training mode is on, write to the gravities table
-    if config["train"]:
-        final.to_csv(output_stream, header=False, index=False)
+def _to_section(config: dict[str, any]) -> Callable[[Capture], Section]:
+    def transform(capture: Capture) -> Section:
+        if len(capture) == 0:
+            raise Exception("Motion sensor did not record any data")
+
+        return Section(
+            config["device_id"],
+            capture.local_datetimes(),
+            magnitudes(capture.values),
+            capture.utc_offset_ns() // 1000,
+            capture.metadata,
+        )
 
-        # Write data to gravities table
-        output_stream.seek(0)
+    return transform
 
-        logging.info("Attempting to copy data to gravities table")
-        cursor.copy_from(output_stream, "gravities", sep=",")
-        conn.commit()
 
-        logging.info("Finished writing to gravities table")
+def _write_section(
+    writer: DatabaseWriter, written_sections: list[Future], config: dict[str, any]
+) -> Callable[[Section], None]:
+    def write(section: Section) -> None:
+        # The section is spooled to disk, the writer thread stores it
+        future = writer.submit(section)
+        logging.info(
+            f"Spooled section for writing ({writer.queue_depth} spooled, "
+            f"last write took {writer.flush_latency} s)"
+        )
 
-    # If not in training mode, send the data to real-time scoring
-    else:
-        res = None
-        if config["rts_url"] != "":
-            # Make rts_url more intuituve to work with
-            res = requests.post(
-                url=config["rts_url"],
-                json={"data": final.to_dict(orient='records')},
+        if config["number_measurements"] != "infinite":
+            written_sections.append(future)
+            logging.info(
+                f"Measurement {len(written_sections)} of "
+                f'{config["number_measurements"]} finished'
             )
 
-            logging.info(f"Wrote to RTS with response {res}")
-        else:
-            # TODO: Save data that's being wasted?
-            logging.warning("No RTS URL set. Will not attempt to POST.")
+    return write
+
+
+def _start_sensors(config: dict[str, any]) -> tuple[LIS3DH, ADS1015, AcquisitionEngine]:
+    # Initialize Sensors
+    logging.info("Intializing sensors")
+    motionsensor = LIS3DH.SPI(**config["motionsensor_spi"])
+    adc = ADS1015.I2C(**config["adc_i2c"])
+    logging.info("Sensors Initialized")
 
-        cursor.close()
-    return id
+    # Configure sensors
+    logging.info("Configuring sensors")
+    motionsensor.set_datarate(5376)
+    motionsensor.enable_axes()
+    motionsensor.use_circular_buffer(config["buffer_length"])
+
+    # an object is detected once when it shows up, not for as long as it
+    # stays in front of the sensor
+    adc.set_trigger(config["adc_threshold"], config["adc_hysteresis"])
+
+    # both sensors run in one acquisition process
+    engine = AcquisitionEngine()
+    engine.add(motionsensor)
+    engine.add(adc)
+    engine.start()
+    logging.info("Sensors Configured")
+
+    return motionsensor, adc, engine
+
+
+def measure_startup() -> dict[str, float]:
+    # Seconds spent in each phase of bringing the sensors up, up to the first
+    # ADC reading the event loop would take
+    config = _parse_config()
+    phases = {}
+
+    start = time.perf_counter()
+    motionsensor, adc, engine = _start_sensors(config)
+    phases["sensor start"] = time.perf_counter() - start
+
+    # the first reply comes once the subprocess has set the sensors up
+    start = time.perf_counter()
+    adc.read()
+    phases["sensor init"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    motionsensor.read()
+    phases["first motion reading"] = time.perf_counter() - start
+
+    engine.stop()
+
+    # loaded by the writer when it first connects
+    start = time.perf_counter()
+    import psycopg2  # noqa: F401
+
+    phases["database import"] = time.perf_counter() - start
+
+    return phases
 
 
 def main() -> None:
@@ -123,48 +211,68 @@ def main() -> None:
     logging.info(f'{" Beginning of script ":=^50}')
 
     try:
-        # Initialize Sensors
-        logging.info("Intializing sensors")
-        motionsensor = LIS3DH.SPI(**config["motionsensor_spi"])
-        adc = ADS1015.I2C(**config["adc_i2c"])
-        logging.info("Sensors Initialized")
-
-        # Configure sensors
-        logging.info("Configuring sensors")
-        motionsensor.set_datarate(5376)
-        motionsensor.enable_axes()
-        motionsensor.start()
-
-        adc.start()
-        logging.info("Sensors Configured")
-
-        # Initialize Database connection
-        logging.info("Connecting to Postgres Database")
-        conn = psycopg2.connect(**config["rdb_access"])
-        logging.info("Successfuly connected to Postgres Database")
+        motionsensor, adc, engine = _start_sensors(config)
+
+        # Sections are spooled to disk and written by a background thread,
+        # which connects to the database when it has something to write
+        spool = Spool(os.path.join(BASE_PATH, config["spool_dir"]))
+        rts = RTSClient(
+            config["rts_url"],
+            **config["rts_access"],
+            payload_format=config["rts_format"],
+            compression=config["rts_compression"],
+            timeformat=config["timeformat"],
+        )
+        writer = DatabaseWriter(
+            _connect_to_database(config),
+            spool,
+            config["gravities_types"],
+            config["copy_format"],
+            config["timeformat"],
+            upload=None if config["train"] else rts.upload,
+            store_metadata=config["store_capture_metadata"],
+        )
+        writer.start()
+
+        # Capture of the next object runs while the previous one is still
+        # being processed and written
+        written_sections = []
+        pipeline = Pipeline(
+            [
+                Source("trigger", _detect_objects(adc, config)),
+                Stage("capture", _capture_window(motionsensor, config)),
+                Stage("transform", _to_section(config)),
+                Stage("sink", _write_section(writer, written_sections, config)),
+            ]
+        )
 
         logging.info("Beginning measurement event loop")
-
-        if config["number_measurements"] != "infinite":
-            written_sections = []
-            for i in range(config["number_measurements"]):
-                written_sections.append(_event_loop(motionsensor, adc, conn, config))
-                logging.info(
-                    f'Measurement {i + 1} of {config["number_measurements"]} finished'
-                )
-            logging.info(f"Finished writing {i + 1} sections:")
-            logging.info(", ".join([str(x) for x in written_sections]))
-        else:
+        if config["number_measurements"] == "infinite":
             logging.info("Measuring indefinitely...")
-            while True:
-                _event_loop(motionsensor, adc, conn, config)
+
+        pipeline.start()
+        pipeline.join()
+
+        logging.info(f"Stage timings: {pipeline.format_timings()}")
+
+        # wait for the writer to catch up
+        writer.stop()
+        rts.close()
+        written_sections = [
+            future.result() for future in written_sections if not future.exception()
+        ]
+        logging.info(f"Finished writing {len(written_sections)} sections:")
+        logging.info(", ".join([str(x) for x in written_sections]))
+
+        # e.g. the ADC controller died, which ended the pipeline early
+        if pipeline.error is not None:
+            raise pipeline.error
 
     except Exception as e:
         logging.exception(e)
 
     logging.info("Shutting sensors down")
-    motionsensor.stop()
-    adc.stop()
+    engine.stop()
     logging.info("Finishing script")
 
 
@@ -0,0 +1,69 @@
+import multiprocessing as mp
+import time
+
+import pytest
+
+import edge_ai.controller as controller
+from edge_ai.emulator import LIS3DHEmulator
+
+
+def _lis3dh(clock_error: float = 0.0) -> tuple[controller.accel.LIS3DH, LIS3DHEmulator]:
+    emulator = LIS3DHEmulator(clock_error=clock_error)
+    motionsensor = controller.accel.LIS3DH.Simulated(emulator)
+    motionsensor.set_datarate(100)
+    motionsensor.use_fifo(True)
+    motionsensor._start_internal()
+
+    return motionsensor, emulator
+
+
+def _capture(motionsensor, seconds: float) -> list[tuple[int, int]]:
+    # Drives the FIFO capture like the subprocess loop, (timestamp, time it
+    # was yielded at) for every sample
+    samples = []
+    for sample in motionsensor._capture_fifo(seconds):
+        if isinstance(sample, float):
+            time.sleep(max(0.0, sample - time.monotonic()))
+        else:
+            samples.append((sample[0], time.monotonic_ns()))
+
+    return samples
+
+
+def test_fast_odr_does_not_drift_ahead_of_the_clock():
+    # 25% more samples than the data rate gives
+    motionsensor, _ = _lis3dh(clock_error=-0.2)
+
+    samples = _capture(motionsensor, 1.5)
+    timestamps = [timestamp for timestamp, _ in samples]
+
+    assert len(samples) > 1.5 * 100
+    assert all(timestamp <= yielded for timestamp, yielded in samples)
+    assert all(a < b for a, b in zip(timestamps, timestamps[1:]))
+
+    # the newest sample of every batch is stamped with the read
+    assert samples[-1][1] - timestamps[-1] < 50_000_000
+
+
+def test_read_during_a_fifo_capture_leaves_the_fifo_alone():
+    motionsensor, emulator = _lis3dh()
+    capture = motionsensor._capture_fifo(10)
+
+    sample = next(capture)
+    while isinstance(sample, float):
+        time.sleep(max(0.0, sample - time.monotonic()))
+        sample = next(capture)
+
+    parent, child = mp.Pipe()
+    transactions = emulator.transactions
+    motionsensor._handle_message(child, ("read",))
+
+    assert parent.recv() == sample[1]
+    assert emulator.transactions == transactions
+
+    capture.close()
+
+    # the sensor is read again once the capture is over
+    motionsensor._handle_message(child, ("read",))
+    assert parent.recv() == pytest.approx([0.0, 0.0, 1.0], abs=0.05)
+    assert emulator.transactions > transactions
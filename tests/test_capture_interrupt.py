@@ -0,0 +1,167 @@
+import time
+
+import pytest
+
+import edge_ai.controller as controller
+import edge_ai.sensor as sensor
+from edge_ai.emulator import ADS1015Emulator, LIS3DHEmulator, waveform
+from edge_ai.gpio import FakeLine
+
+LIS3DH = sensor.accel.LIS3DH
+ADS1015 = sensor.adc.ADS1015
+
+I1_ZYXDA = 0b00010000
+
+
+# The capture generators are driven directly, standing in for the
+# subprocess loop: a float is a deadline to sleep until (or until an edge),
+# anything else a sample
+
+
+def _lis3dh(
+    datarate: int = 100,
+) -> tuple[controller.accel.LIS3DH, LIS3DHEmulator]:
+    emulator = LIS3DHEmulator()
+    motionsensor = controller.accel.LIS3DH.Simulated(emulator)
+    motionsensor.set_datarate(datarate)
+    motionsensor.use_fifo(False)
+    motionsensor.use_data_ready_line(FakeLine())
+    motionsensor._start_internal()
+
+    return motionsensor, emulator
+
+
+def _ads1015(
+    data_rate: int = 1600, lo_thresh: int = 0x800, hi_thresh: int = 0x7FF
+) -> tuple[controller.adc.ADS1015, ADS1015Emulator]:
+    emulator = ADS1015Emulator({0: waveform.constant(1.5)})
+    adc = controller.adc.ADS1015.Simulated(emulator)
+    adc.set_data_rate(data_rate)
+    adc.set_lo_thresh(lo_thresh)
+    adc.set_hi_thresh(hi_thresh)
+    adc.use_data_ready_line(FakeLine())
+    adc._start_internal()
+
+    return adc, emulator
+
+
+def test_lis3dh_samples_carry_edge_timestamps():
+    motionsensor, emulator = _lis3dh()
+    capture = motionsensor._capture_interrupt(10)
+
+    assert isinstance(next(capture), float)
+    assert emulator.peek(LIS3DH.CTRL_REG3)[0] & I1_ZYXDA
+
+    for edge in [1_000, 2_000, 3_000]:
+        # nothing is read while waiting for the edge
+        time.sleep(0.015)
+        transactions = emulator.transactions
+        motionsensor._ready_line.trigger(edge)
+
+        timestamp, values = next(capture)
+        assert timestamp == edge
+        assert values == pytest.approx([0.0, 0.0, 1.0], abs=0.02)
+        assert emulator.transactions == transactions + 1
+
+        assert isinstance(next(capture), float)
+
+    capture.close()
+
+
+def test_lis3dh_waits_two_periods_for_a_missed_edge():
+    motionsensor, _ = _lis3dh(datarate=100)
+    capture = motionsensor._capture_interrupt(10)
+
+    deadline = next(capture)
+    assert deadline - time.monotonic() == pytest.approx(0.02, abs=0.005)
+
+    # no edge: the new sample is polled once the deadline has passed
+    time.sleep(max(0.0, deadline - time.monotonic()))
+    before = time.monotonic_ns()
+    timestamp, values = next(capture)
+
+    assert before <= timestamp <= time.monotonic_ns()
+    assert values == pytest.approx([0.0, 0.0, 1.0], abs=0.02)
+
+    capture.close()
+
+
+def test_lis3dh_restores_ctrl_reg3():
+    motionsensor, emulator = _lis3dh()
+
+    # closed early, e.g. when the subprocess is stopped
+    capture = motionsensor._capture_interrupt(10)
+    next(capture)
+    capture.close()
+    assert not emulator.peek(LIS3DH.CTRL_REG3)[0] & I1_ZYXDA
+
+    # run to the end
+    samples = list(motionsensor._capture_interrupt(0.05))
+    assert not emulator.peek(LIS3DH.CTRL_REG3)[0] & I1_ZYXDA
+    assert any(not isinstance(sample, float) for sample in samples)
+
+
+def test_ads1015_samples_carry_edge_timestamps():
+    adc, emulator = _ads1015()
+    capture = adc._capture_interrupt(10)
+
+    assert isinstance(next(capture), float)
+
+    # comparator set up as a conversion ready pin
+    assert emulator.peek(ADS1015.HI_THRESH_REGISTER)[0] & 0x80
+    assert not emulator.peek(ADS1015.LO_THRESH_REGISTER)[0] & 0x80
+    assert emulator.peek(ADS1015.CONFIG_REGISTER)[1] & 0b11 != 0b11
+
+    for edge in [1_000, 2_000, 3_000]:
+        time.sleep(0.002)
+        transactions = emulator.transactions
+        adc._ready_line.trigger(edge)
+
+        timestamp, value = next(capture)
+        assert timestamp == edge
+        assert value == pytest.approx(1.5, abs=0.01)
+        assert emulator.transactions == transactions + 1
+
+        assert isinstance(next(capture), float)
+
+    capture.close()
+
+
+def test_ads1015_waits_two_periods_for_a_missed_edge():
+    adc, _ = _ads1015(data_rate=250)
+    capture = adc._capture_interrupt(10)
+
+    deadline = next(capture)
+    assert deadline - time.monotonic() == pytest.approx(0.008, abs=0.003)
+
+    time.sleep(max(0.0, deadline - time.monotonic()))
+    before = time.monotonic_ns()
+    timestamp, value = next(capture)
+
+    assert before <= timestamp <= time.monotonic_ns()
+    assert value == pytest.approx(1.5, abs=0.01)
+
+    capture.close()
+
+
+def test_ads1015_restores_comparator_config():
+    adc, emulator = _ads1015(lo_thresh=0x100, hi_thresh=0x700)
+
+    registers = [
+        ADS1015.CONFIG_REGISTER,
+        ADS1015.LO_THRESH_REGISTER,
+        ADS1015.HI_THRESH_REGISTER,
+    ]
+    configured = [emulator.peek(register) for register in registers]
+    assert configured[1:] == [[0x10, 0x00], [0x70, 0x00]]
+
+    # closed early
+    capture = adc._capture_interrupt(10)
+    next(capture)
+    assert [emulator.peek(register) for register in registers] != configured
+    capture.close()
+    assert [emulator.peek(register) for register in registers] == configured
+
+    # run to the end
+    list(adc._capture_interrupt(0.02))
+    assert [emulator.peek(register) for register in registers] == configured
@@ -0,0 +1,55 @@
+import threading
+
+from edge_ai.pipeline import STOP, Pipeline, Source, Stage
+
+
+def test_raising_source_ends_the_pipeline():
+    calls = 0
+
+    def detect():
+        # like wait_for_trigger on a controller whose subprocess died
+        nonlocal calls
+        calls += 1
+        if calls > 2:
+            raise EOFError()
+
+        return calls
+
+    received = []
+    pipeline = Pipeline(
+        [
+            Source("trigger", detect),
+            Stage("double", lambda item: 2 * item),
+            Stage("sink", received.append),
+        ]
+    )
+
+    pipeline.start()
+    pipeline.join(5)
+
+    assert not any(thread.name == "trigger" for thread in threading.enumerate())
+    assert calls == 3
+    assert received == [2, 4]
+    assert isinstance(pipeline.error, EOFError)
+
+
+def test_failing_stage_drops_the_item_only():
+    items = iter([1, 0, 2])
+
+    def source():
+        return next(items, STOP)
+
+    received = []
+    pipeline = Pipeline(
+        [
+            Source("source", source),
+            Stage("invert", lambda item: 1 / item),
+            Stage("sink", received.append),
+        ]
+    )
+
+    pipeline.start()
+    pipeline.join(5)
+
+    assert received == [1.0, 0.5]
+    assert pipeline.error is None
@@ -0,0 +1,253 @@
+import gzip
+import os
+import io
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pytest
+
+from edge_ai.sink import DatabaseWriter, RTSClient, Section, Spool
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    # keeps connections open between requests
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self) -> None:
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        self.server.requests.append(
+            {"client": self.client_address, "headers": dict(self.headers), "body": body}
+        )
+
+        self.send_response(self.server.status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+    server.requests = []
+    server.status = 200
+
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    yield server
+
+    server.shutdown()
+    server.server_close()
+
+
+def _url(server: ThreadingHTTPServer) -> str:
+    return f"http://127.0.0.1:{server.server_address[1]}/"
+
+
+def _batch() -> list[tuple[int, Section]]:
+    start = np.datetime64("2024-01-01T12:00:00", "us")
+
+    return [
+        (
+            id,
+            Section(
+                device_id,
+                start + np.arange(length) * np.timedelta64(1000, "us"),
+                np.linspace(0.5, 1.5, length),
+                3_600_000_000,
+            ),
+        )
+        for id, device_id, length in [(10, 1, 5), (11, 2, 3)]
+    ]
+
+
+def test_upload_reuses_one_connection(server):
+    client = RTSClient(_url(server))
+
+    client.upload(_batch())
+    client.upload(_batch())
+    client.close()
+
+    assert len(server.requests) == 2
+    assert server.requests[0]["client"] == server.requests[1]["client"]
+
+
+def test_npz_gzip_body_decodes_to_the_sent_columns(server):
+    batch = _batch()
+    client = RTSClient(_url(server), payload_format="npz", compression="gzip")
+    client.upload(batch)
+    client.close()
+
+    request = server.requests[0]
+    assert request["headers"]["Content-Type"] == "application/x-npz"
+    assert request["headers"]["Content-Encoding"] == "gzip"
+
+    columns = np.load(io.BytesIO(gzip.decompress(request["body"])))
+    sections = [section for _, section in batch]
+
+    assert columns["section_id"].tolist() == [10, 11]
+    assert columns["device_id"].tolist() == [1, 2]
+    assert columns["utc_offset"].tolist() == [3_600_000_000] * 2
+    assert columns["offsets"].tolist() == [0, 5, 8]
+    np.testing.assert_array_equal(
+        columns["times"], np.concatenate([section.times for section in sections])
+    )
+    np.testing.assert_array_equal(
+        columns["gravity"],
+        np.concatenate([section.gravities for section in sections]),
+    )
+
+
+def test_json_fallback(server):
+    batch = _batch()
+    client = RTSClient(_url(server))
+    client.upload(batch)
+    client.close()
+
+    request = server.requests[0]
+    assert request["headers"]["Content-Type"] == "application/json"
+    assert "Content-Encoding" not in request["headers"]
+
+    records = json.loads(request["body"])["data"]
+    _, section = batch[0]
+
+    assert len(records) == 8
+    assert [record["section_id"] for record in records] == [10] * 5 + [11] * 3
+    assert records[1] == {
+        "section_id": 10,
+        "time": "2024-01-01 12:00:00.001000",
+        "gravity": section.gravities[1],
+    }
+
+
+class _Connection:
+    def cursor(self) -> "_Connection":
+        return self
+
+    def copy_expert(self, query: str, stream) -> None:
+        pass
+
+    def commit(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class _Writer(DatabaseWriter):
+    # Database side left out, sections get consecutive ids. Sections of the
+    # devices in rejected are refused, error is raised on every insert.
+    next_id = 1
+    rejected = ()
+    error = None
+
+    def _insert_sections(self, cursor, sections: list[Section]) -> list[int]:
+        if self.error is not None:
+            raise self.error
+        if any(section.device_id in self.rejected for section in sections):
+            raise Exception("invalid input value")
+
+        ids = list(range(self.next_id, self.next_id + len(sections)))
+        self.next_id += len(sections)
+
+        return ids
+
+
+def test_failed_upload_leaves_sections_spooled(server, tmp_path):
+    server.status = 500
+    client = RTSClient(_url(server))
+    spool = Spool(str(tmp_path))
+    writer = _Writer(
+        _Connection, spool, ["int4", "timestamp", "float8"], upload=client.upload
+    )
+
+    for _, section in _batch():
+        writer.submit(section)
+
+    assert not writer._drain()
+    assert len(spool) == 2
+    assert len(server.requests) == 1
+
+    # the script is restarted, the ids are kept in the spool
+    spool.close()
+    spool = Spool(str(tmp_path))
+    writer = _Writer(
+        _Connection, spool, ["int4", "timestamp", "float8"], upload=client.upload
+    )
+    writer.next_id = 3
+
+    # uploaded again with the same ids once the server is back
+    server.status = 200
+    assert writer._drain()
+    assert len(spool) == 0
+
+    records = json.loads(server.requests[-1]["body"])["data"]
+    assert sorted({record["section_id"] for record in records}) == [1, 2]
+    assert writer.next_id == 3
+
+    # released along with the sections
+    spool.close()
+    spool = Spool(str(tmp_path))
+    assert spool._committed == {}
+
+    client.close()
+    spool.close()
+
+
+def test_rejected_section_is_moved_to_the_dead_spool(tmp_path):
+    spool = Spool(str(tmp_path))
+    writer = _Writer(
+        _Connection, spool, ["int4", "timestamp", "float8"], max_attempts=2
+    )
+    writer.rejected = (2,)
+
+    start = np.datetime64("2024-01-01T12:00:00", "us")
+    futures = [
+        writer.submit(Section(device_id, start + np.arange(3), np.ones(3), 0))
+        for device_id in [1, 2, 3]
+    ]
+
+    # retried as is until max_attempts
+    assert not writer._drain()
+    assert not writer._drain()
+    assert len(spool) == 3
+
+    assert writer._drain()
+    assert len(spool) == 0
+    assert futures[0].result() == 1
+    assert futures[2].result() == 2
+    with pytest.raises(Exception):
+        futures[1].result()
+
+    dead = Spool(os.path.join(str(tmp_path), "dead"))
+    [(_, section)] = dead.read(10)
+    assert section.device_id == 2
+
+    dead.close()
+    spool.close()
+
+
+def test_unreachable_database_is_retried_for_good(tmp_path):
+    spool = Spool(str(tmp_path))
+    writer = _Writer(
+        _Connection, spool, ["int4", "timestamp", "float8"], max_attempts=2
+    )
+    writer.error = ConnectionError("could not connect to server")
+
+    for _, section in _batch():
+        writer.submit(section)
+
+    for _ in range(5):
+        assert not writer._drain()
+    assert len(spool) == 2
+
+    writer.error = None
+    assert writer._drain()
+    assert writer.next_id == 3
+    assert not os.path.exists(os.path.join(str(tmp_path), "dead"))
+
+    spool.close()